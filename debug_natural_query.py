@@ -5,15 +5,27 @@ This script shows all the outputs from the LLM and query execution.
 """
 
 import asyncio
-import json
+import base64
+import hashlib
 import logging
 import os
+import pickle
+import sqlite3
 import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import orjson
 from dotenv import load_dotenv
+from openai import OpenAI
 
 from src.mcp_server_neo4j_ehr.modules.db_connection import create_neo4j_driver, Neo4jConnection
 from src.mcp_server_neo4j_ehr.modules.functionality.natural_query import natural_query
-from src.mcp_server_neo4j_ehr.modules.constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_MARKDOWN
+from src.mcp_server_neo4j_ehr.modules.constants import (
+    OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_MARKDOWN, EMBEDDING_MODEL, EMBEDDING_DIMENSION
+)
 
 # Configure logging to show all output
 logging.basicConfig(
@@ -24,55 +36,232 @@ logging.basicConfig(
 # Also log debug messages from our module
 logging.getLogger('src.mcp_server_neo4j_ehr').setLevel(logging.DEBUG)
 
+# Semantic cache settings
+CACHE_PATH = Path(__file__).with_name(".natural_query_cache.pkl")
+EMBEDDING_CACHE_PATH = Path(__file__).with_name(".embedding_cache.sqlite3")
+SIMILARITY_THRESHOLD = 0.95
+CACHE_TTL = float(os.getenv("NL_CACHE_TTL", "3600"))
+CACHE_MAX_ENTRIES = 1024
+CACHE_FORMAT_VERSION = 2
 
-async def test_query(query_text: str):
-    """Test a natural language query and show all outputs."""
-    
-    load_dotenv()
-    
-    # Check for required environment variables
-    neo4j_uri = os.getenv("NEO4J_URI")
-    neo4j_username = os.getenv("NEO4J_USERNAME")
-    neo4j_password = os.getenv("NEO4J_PASSWORD")
-    neo4j_database = os.getenv("NEO4J_DATABASE", "neo4j")
-    openai_api_key = os.getenv("OPENAI_API_KEY")
+# Embedding request parameters, fixed for the lifetime of the script. Asking for
+# base64 explicitly hands back the raw float32 bytes instead of a list of floats.
+EMBEDDING_REQUEST = {
+    "model": EMBEDDING_MODEL,
+    "dimensions": EMBEDDING_DIMENSION,
+    "encoding_format": "base64",
+}
+
+# Result display settings
+PREVIEW_ROWS = 5
+
+
+class SemanticCache:
+    """Embedding-based cache of natural_query results, persisted next to this script.
+
+    Each bucket holds a float32 matrix of L2-normalized query embeddings, the
+    JSON results returned for them, and per-entry insert/last-hit timestamps.
+    Buckets are keyed by embedding model, limit, format and schema version so a
+    parameter or schema change never serves a stale result. Entries older than
+    the TTL are ignored, and the least recently hit entries are evicted once the
+    cache grows past its size bound.
+    """
+
+    def __init__(
+        self,
+        path: Path = CACHE_PATH,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl: float = CACHE_TTL,
+        max_entries: int = CACHE_MAX_ENTRIES
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._buckets: Dict[str, Dict[str, Any]] = {}
+        if path.exists():
+            with path.open("rb") as f:
+                data = pickle.load(f)
+            # Silently drop caches written in an older layout
+            if isinstance(data, dict) and data.get("version") == CACHE_FORMAT_VERSION:
+                self._buckets = data["buckets"]
+
+    @staticmethod
+    def key(limit: int, display_limit: int, format: str, schema_version: str) -> str:
+        """Build the bucket key for a set of query parameters."""
+        return hashlib.sha256(
+            f"{EMBEDDING_MODEL}|{limit}|{display_limit}|{format}|{schema_version}".encode()
+        ).hexdigest()
+
+    def lookup(self, key: str, embedding: np.ndarray) -> Optional[str]:
+        """Return the cached result of the most similar fresh query, if close enough."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return None
+        now = time.time()
+        sims = bucket["matrix"] @ embedding
+        sims[now - bucket["inserted"] > self.ttl] = -1.0
+        best = int(np.argmax(sims))
+        if sims[best] < self.threshold:
+            return None
+        bucket["last_hit"][best] = now
+        return bucket["results"][best]
+
+    def add(self, key: str, embedding: np.ndarray, result: str) -> None:
+        """Store a result, evict stale entries and persist the cache to disk."""
+        now = time.time()
+        bucket = self._buckets.setdefault(key, {
+            "matrix": np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32),
+            "results": [],
+            "inserted": np.empty(0),
+            "last_hit": np.empty(0),
+        })
+        bucket["matrix"] = np.vstack([bucket["matrix"], embedding[np.newaxis, :]])
+        bucket["results"].append(result)
+        bucket["inserted"] = np.append(bucket["inserted"], now)
+        bucket["last_hit"] = np.append(bucket["last_hit"], now)
+        self._evict(now)
+        self.save()
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then the least recently hit ones beyond the size bound."""
+        keep: Dict[str, np.ndarray] = {
+            key: now - bucket["inserted"] <= self.ttl for key, bucket in self._buckets.items()
+        }
+        live = [
+            (last_hit, key, i)
+            for key, bucket in self._buckets.items()
+            for i, last_hit in enumerate(bucket["last_hit"])
+            if keep[key][i]
+        ]
+        if len(live) > self.max_entries:
+            live.sort()
+            for _, key, i in live[:len(live) - self.max_entries]:
+                keep[key][i] = False
+
+        for key in list(self._buckets):
+            mask = keep[key]
+            if mask.all():
+                continue
+            bucket = self._buckets[key]
+            if not mask.any():
+                del self._buckets[key]
+                continue
+            bucket["matrix"] = bucket["matrix"][mask]
+            bucket["results"] = [r for r, k in zip(bucket["results"], mask) if k]
+            bucket["inserted"] = bucket["inserted"][mask]
+            bucket["last_hit"] = bucket["last_hit"][mask]
+
+    def save(self) -> None:
+        """Write the cache to disk, including hit times recorded by lookup."""
+        with self.path.open("wb") as f:
+            pickle.dump({"version": CACHE_FORMAT_VERSION, "buckets": self._buckets}, f)
+
+
+def schema_version(schema: Dict[str, Any]) -> str:
+    """Fingerprint a schema so any schema change starts a new cache generation."""
+    return hashlib.sha256(orjson.dumps(schema, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()[:16]
+
+
+class EmbeddingCache:
+    """On-disk store of normalized query embeddings keyed by SHA-256 of the query."""
+
+    def __init__(self, path: Path = EMBEDDING_CACHE_PATH):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+
+    @staticmethod
+    def key(query_text: str) -> str:
+        """Hash the embedding model and normalized query text."""
+        normalized = query_text.strip().lower()
+        return hashlib.sha256(f"{EMBEDDING_MODEL}|{normalized}".encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Return the stored embedding for a key, if any."""
+        row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+    def put(self, key: str, embedding: np.ndarray) -> None:
+        """Store an embedding."""
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                (key, embedding.tobytes())
+            )
+
+
+# Scratch buffer reused for every freshly fetched embedding
+_embed_scratch = np.empty(EMBEDDING_DIMENSION, dtype=np.float32)
+
+
+def embed_query(client: OpenAI, query_text: str, cache: EmbeddingCache) -> np.ndarray:
+    """Embed a query and L2-normalize it so similarity is a plain dot product.
     
-    if not all([neo4j_uri, neo4j_username, neo4j_password, openai_api_key]):
-        print("Error: Required environment variables not set.")
-        print("Please ensure NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, and OPENAI_API_KEY are set.")
-        return
+    Embeddings are normalized once at insert time and served from the on-disk
+    cache on repeat queries, skipping the OpenAI round-trip. Fresh embeddings are
+    decoded into a shared scratch buffer, so the returned array is only valid
+    until the next call.
+    """
+    key = EmbeddingCache.key(query_text)
+    embedding = cache.get(key)
+    if embedding is not None:
+        return embedding
     
-    # Create database connection
-    driver = create_neo4j_driver(neo4j_uri, neo4j_username, neo4j_password)
-    db = Neo4jConnection(driver, neo4j_database)
+    response = client.embeddings.create(input=query_text, **EMBEDDING_REQUEST)
+    embedding = _embed_scratch
+    np.copyto(embedding, np.frombuffer(base64.b64decode(response.data[0].embedding), dtype=np.float32))
+    embedding /= np.linalg.norm(embedding)
+    cache.put(key, embedding)
+    return embedding
+
+
+async def test_query(
+    db: Neo4jConnection,
+    query_text: str,
+    openai_api_key: str,
+    client: OpenAI,
+    cache: SemanticCache,
+    embeddings: EmbeddingCache
+):
+    """Test a natural language query and show all outputs."""
     
     try:
-        print(f"\nTesting connection to Neo4j...")
-        if await db.test_connection():
-            print("✓ Connected to Neo4j successfully!")
-        else:
-            print("✗ Failed to connect to Neo4j")
-            return
-        
         print(f"\nProcessing query: '{query_text}'")
         print("-" * 80)
-        
-        # Execute the natural language query
-        result = await natural_query(
-            db,
-            query=query_text,
-            limit=10,
-            format=OUTPUT_FORMAT_JSON,
-            openai_api_key=openai_api_key
-        )
-        
+
+        # Check the semantic cache before going to the LLM
+        limit = 10
+        cache_key = SemanticCache.key(limit, PREVIEW_ROWS, OUTPUT_FORMAT_JSON, schema_version(await db.get_schema()))
+        embedding = embed_query(client, query_text, embeddings)
+        result = cache.lookup(cache_key, embedding)
+        cache_hit = result is not None
+
+        if cache_hit:
+            print("✓ Semantic cache hit - skipping natural_query")
+        else:
+            # Execute the natural language query
+            result = await natural_query(
+                db,
+                query=query_text,
+                limit=limit,
+                format=OUTPUT_FORMAT_JSON,
+                openai_api_key=openai_api_key,
+                display_limit=PREVIEW_ROWS  # Only fetch the rows we display
+            )
+
         # Parse and display results
-        data = json.loads(result)
-        
+        data = orjson.loads(result)
+
+        # Only successful results are worth reusing
+        if not cache_hit and "error" not in data:
+            cache.add(cache_key, embedding, result)
+
         print("\n" + "="*80)
         print("QUERY RESULTS")
         print("="*80)
-        
+
         if "error" in data:
             print(f"ERROR: {data['error']}")
             if "details" in data:
@@ -85,22 +274,83 @@ async def test_query(query_text: str):
             print(f"  {data.get('cypher_query', 'N/A')}")
             print(f"\nResult Count: {data.get('count', 0)}")
             print(f"\nResults:")
-            results = data.get('results', [])
+            all_results = data.get('results', [])
+            results = all_results[:PREVIEW_ROWS]
             if results:
-                for i, result in enumerate(results[:5]):  # Show first 5 results
-                    print(f"  [{i+1}] {json.dumps(result, indent=4)}")
-                if len(results) > 5:
-                    print(f"  ... and {len(results) - 5} more results")
+                # Write rows straight to the byte stream; flush text first to keep ordering
+                sys.stdout.flush()
+                out = sys.stdout.buffer
+                for i, row in enumerate(results):
+                    out.write(f"  [{i+1}] ".encode())
+                    out.write(orjson.dumps(row, option=orjson.OPT_INDENT_2))
+                    out.write(b"\n")
+                out.flush()
+                if len(all_results) > len(results):
+                    print(f"  ... and {len(all_results) - len(results)} more results")
             else:
                 print("  No results found")
-        
+
         print("="*80 + "\n")
-        
+
     except Exception as e:
         print(f"\nError: {e}")
         import traceback
         traceback.print_exc()
+
+
+async def run(queries: Optional[List[str]] = None):
+    """Open one driver and event loop and run queries against them.
+
+    With no queries given, read them interactively until the user quits.
+    """
+    
+    load_dotenv()
+    
+    # Check for required environment variables
+    neo4j_uri = os.getenv("NEO4J_URI")
+    neo4j_username = os.getenv("NEO4J_USERNAME")
+    neo4j_password = os.getenv("NEO4J_PASSWORD")
+    neo4j_database = os.getenv("NEO4J_DATABASE", "neo4j")
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    
+    if not all([neo4j_uri, neo4j_username, neo4j_password, openai_api_key]):
+        print("Error: Required environment variables not set.")
+        print("Please ensure NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, and OPENAI_API_KEY are set.")
+        return
+    
+    # Create the database connection once and reuse its pool for every query
+    driver = create_neo4j_driver(neo4j_uri, neo4j_username, neo4j_password)
+    db = Neo4jConnection(driver, neo4j_database, neo4j_uri)
+    client = OpenAI(api_key=openai_api_key)
+    cache = SemanticCache()
+    embeddings = EmbeddingCache()
+    
+    try:
+        print(f"\nTesting connection to Neo4j...")
+        if await db.test_connection():
+            print("✓ Connected to Neo4j successfully!")
+        else:
+            print("✗ Failed to connect to Neo4j")
+            return
+        
+        if queries is not None:
+            for query in queries:
+                await test_query(db, query, openai_api_key, client, cache, embeddings)
+            return
+        
+        while True:
+            try:
+                # Read input off the loop thread so the driver stays on one warm loop
+                query = (await asyncio.to_thread(input, "Query> ")).strip()
+            except (KeyboardInterrupt, EOFError):
+                print("\nExiting...")
+                break
+            if query.lower() in ['quit', 'exit', 'q']:
+                break
+            if query:
+                await test_query(db, query, openai_api_key, client, cache, embeddings)
     finally:
+        cache.save()
         await driver.close()
 
 
@@ -110,7 +360,7 @@ def main():
     # Check if query was provided as command line argument
     if len(sys.argv) > 1:
         query = " ".join(sys.argv[1:])
-        asyncio.run(test_query(query))
+        asyncio.run(run([query]))
     else:
         # Interactive mode
         print("Neo4j EHR Natural Language Query Debugger")
@@ -118,19 +368,11 @@ def main():
         print("Enter natural language queries to test, or 'quit' to exit.")
         print()
         
-        while True:
-            try:
-                query = input("Query> ").strip()
-                if query.lower() in ['quit', 'exit', 'q']:
-                    break
-                if query:
-                    asyncio.run(test_query(query))
-            except KeyboardInterrupt:
-                print("\nExiting...")
-                break
-            except Exception as e:
-                print(f"Error: {e}")
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            print("\nExiting...")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
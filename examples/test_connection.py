@@ -32,33 +32,35 @@ async def test_connection():
     
     # Create driver and connection
     driver = create_neo4j_driver(uri, username, password)
-    db = Neo4jConnection(driver, database)
+    db = Neo4jConnection(driver, database, uri)
     
     try:
-        # Test connection
-        if await db.test_connection():
-            print("✓ Connection successful!")
-        else:
-            print("✗ Connection failed!")
-            return
-        
-        # Get schema info
-        print("\nFetching database schema...")
-        schema = await db.get_schema()
-        
-        print(f"\nFound {len(schema['nodes'])} node types:")
-        for node in schema['nodes']:
-            print(f"  - {node.get('label', 'Unknown')}")
-        
-        print(f"\nFound {len(schema['relationships'])} relationship types:")
-        for rel in schema['relationships']:
-            print(f"  - {rel.get('relationshipType', 'Unknown')}")
-        
-        # Test a simple query
-        print("\nTesting patient count query...")
-        result = await db.execute_read("MATCH (p:Patient) RETURN count(p) as count")
-        if result:
-            print(f"✓ Found {result[0]['count']} patients in the database")
+        # Reuse one session for every query in this script
+        async with db.session() as session:
+            # Test connection
+            if await db.test_connection(session=session):
+                print("✓ Connection successful!")
+            else:
+                print("✗ Connection failed!")
+                return
+            
+            # Get schema info
+            print("\nFetching database schema...")
+            schema = await db.get_schema()
+            
+            print(f"\nFound {len(schema['nodes'])} node types:")
+            for node in schema['nodes']:
+                print(f"  - {node.get('label', 'Unknown')}")
+            
+            print(f"\nFound {len(schema['relationships'])} relationship types:")
+            for rel in schema['relationships']:
+                print(f"  - {rel.get('relationshipType', 'Unknown')}")
+            
+            # Test a simple query
+            print("\nTesting patient count query...")
+            result = await db.execute_read("MATCH (p:Patient) RETURN count(p) as count", session=session)
+            if result:
+                print(f"✓ Found {result[0]['count']} patients in the database")
         
     except Exception as e:
         print(f"✗ Error: {e}")
@@ -1,26 +1,35 @@
 #!/usr/bin/env python3
 """
 Wrapper script to run the Neo4j EHR MCP server.
-This script uses uv to run the server in its proper environment.
+This script runs the server in-process when its dependencies are importable,
+and falls back to uv to run it in its proper environment otherwise.
 """
-import subprocess
 import sys
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
-# Change to the Neo4j server directory
+# Change to the Neo4j server directory so .env is picked up
 server_dir = Path(__file__).parent
 os.chdir(server_dir)
+sys.path.insert(0, str(server_dir / "src"))
 
-# Run the server using uv in the correct environment
-try:
-    result = subprocess.run([
-        "uv", "run", "python", "-m", "mcp_server_neo4j_ehr"
-    ], check=False)
-    sys.exit(result.returncode)
-except FileNotFoundError:
-    print("Error: uv not found. Please install uv or use a different approach.", file=sys.stderr)
-    sys.exit(1)
-except Exception as e:
-    print(f"Error running server: {e}", file=sys.stderr)
-    sys.exit(1)
\ No newline at end of file
+# Packages the server imports. Probed without importing them, since __main__
+# defers the (slow) server import until arguments are parsed.
+SERVER_DEPENDENCIES = ("dotenv", "fastmcp", "neo4j", "openai")
+
+if all(find_spec(name) is not None for name in SERVER_DEPENDENCIES):
+    from mcp_server_neo4j_ehr.__main__ import main
+else:
+    # Dependencies not on this interpreter's path; hand the process over to uv
+    try:
+        os.execvp("uv", ["uv", "run", "python", "-m", "mcp_server_neo4j_ehr", *sys.argv[1:]])
+    except FileNotFoundError:
+        print("Error: uv not found. Please install uv or use a different approach.", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error running server: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,6 @@
 import os
 import argparse
 from dotenv import load_dotenv
-from .server import main as server_main
 
 # Load environment variables
 load_dotenv()
@@ -35,6 +34,9 @@ def main():
     if not args.neo4j_password:
         parser.error("Neo4j password is required (via --neo4j-password or NEO4J_PASSWORD env var)")
     
+    # Import the server (FastMCP, Neo4j, OpenAI) only once arguments are valid
+    from .server import main as server_main
+    
     # Run the server
     server_main(
         args.neo4j_uri,
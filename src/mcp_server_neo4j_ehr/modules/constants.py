@@ -1,48 +1,80 @@
 """Constants for the Neo4j EHR MCP Server."""
 
+import functools
+from importlib import resources
+from typing import Final, Tuple
+
 # Default values
-DEFAULT_LIMIT = 20
-DEFAULT_NOTE_SEARCH_LIMIT = 5
-DEFAULT_NATURAL_QUERY_LIMIT = 10
+DEFAULT_LIMIT: Final[int] = 20
+DEFAULT_NOTE_SEARCH_LIMIT: Final[int] = 5
+DEFAULT_NATURAL_QUERY_LIMIT: Final[int] = 10
 
 # Output formats
-OUTPUT_FORMAT_JSON = "json"
-OUTPUT_FORMAT_TABLE = "table"
-OUTPUT_FORMAT_TEXT = "text"
-OUTPUT_FORMAT_MARKDOWN = "markdown"
+OUTPUT_FORMAT_JSON: Final[str] = "json"
+OUTPUT_FORMAT_TABLE: Final[str] = "table"
+OUTPUT_FORMAT_TEXT: Final[str] = "text"
+OUTPUT_FORMAT_MARKDOWN: Final[str] = "markdown"
 
 # Note types
-NOTE_TYPE_DISCHARGE = "discharge"
-NOTE_TYPE_RADIOLOGY = "radiology"
-NOTE_TYPE_ALL = "all"
+NOTE_TYPE_DISCHARGE: Final[str] = "discharge"
+NOTE_TYPE_RADIOLOGY: Final[str] = "radiology"
+NOTE_TYPE_ALL: Final[str] = "all"
 
 # Embedding model
-EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIMENSION = 1536
+EMBEDDING_MODEL: Final[str] = "text-embedding-3-small"
+EMBEDDING_DIMENSION: Final[int] = 1536
+
+# Cypher generation models: the fallback regenerates a query that failed to run
+NATURAL_QUERY_MODEL: Final[str] = "gpt-4.1-nano"
+NATURAL_QUERY_FALLBACK_MODEL: Final[str] = "gpt-4.1-mini"
 
 # Neo4j indexes
-NOTE_EMBEDDINGS_INDEX = "note_embeddings"
-
-# System prompts for natural language queries
-NATURAL_QUERY_SYSTEM_PROMPT = """You are a Neo4j Cypher query expert specialized in medical/EHR data.
-You will be given a complete database schema with all node properties and a natural language question.
-Generate a valid Cypher query that answers the question. Only return the Cypher query, no explanations.
-
-Important guidelines:
-- Use appropriate WHERE clauses for filtering
-- ALWAYS include LIMIT clauses to prevent large result sets
-- Use indexed properties in WHERE clauses when possible for better performance
-- Use proper node labels and relationship types from the schema
-- Return meaningful data that directly answers the question
-- For text searches in notes, use: WHERE toLower(n.text) CONTAINS toLower('search term')
-- For date comparisons, use proper datetime() functions
-- For finding abnormal lab results: WHERE l.flag IS NOT NULL AND l.flag <> 'normal'
-- Prefer using unique identifiers (subject_id, hadm_id, note_id) when available
-- Include relevant properties in RETURN statements to provide context
-
-Example patterns:
-- Patient data: MATCH (p:Patient {subject_id: '10000032'})
-- Patient admissions: MATCH (p:Patient {subject_id: '10000032'})-[:HAS_ADMISSION]->(a:Admission)
-- Admission diagnoses: MATCH (a:Admission {hadm_id: '12345'})-[:HAS_DIAGNOSIS]->(d:Diagnosis)
-- Lab results: MATCH (l:LabEvent) WHERE l.subject_id = '10000032' AND l.flag = 'abnormal'
-"""
\ No newline at end of file
+NOTE_EMBEDDINGS_INDEX: Final[str] = "note_embeddings"
+
+# Neo4j driver connection pool defaults (overridable via NEO4J_POOL_SIZE / NEO4J_ACQ_TIMEOUT)
+DEFAULT_NEO4J_POOL_SIZE: Final[int] = 50
+DEFAULT_NEO4J_ACQ_TIMEOUT: Final[float] = 60.0
+NEO4J_MAX_CONNECTION_LIFETIME: Final[float] = 3600.0
+
+# Server-side query timeouts in seconds (default overridable via NEO4J_QUERY_TIMEOUT_S)
+DEFAULT_QUERY_TIMEOUT: Final[float] = 30.0
+NOTES_QUERY_TIMEOUT: Final[float] = 15.0
+
+# Retries of a streamed read that fails transiently before its first record,
+# waiting STREAM_READ_RETRY_DELAY seconds, doubled after each attempt
+STREAM_READ_RETRIES: Final[int] = 3
+STREAM_READ_RETRY_DELAY: Final[float] = 0.5
+
+# Seconds the background startup warm-up waits for Neo4j before giving up
+STARTUP_CONNECTION_CHECK_TIMEOUT: Final[float] = 5.0
+
+# Relationships between node labels, shared by the schema output and the LLM prompt:
+# (from label, relationship type, to label, description, cardinality)
+EHR_RELATIONSHIPS: Final[Tuple[Tuple[str, str, str, str, str], ...]] = (
+    ("Patient", "HAS_ADMISSION", "Admission",
+     "Patient has hospital admissions", "1 patient : many admissions"),
+    ("Admission", "INCLUDES_DISCHARGE_NOTE", "DischargeNote",
+     "Admission includes discharge summary notes", "1 admission : many notes"),
+    ("Admission", "INCLUDES_RADIOLOGY_REPORT", "RadiologyReport",
+     "Admission includes radiology reports", "1 admission : many reports"),
+    ("Admission", "INCLUDES_LAB_EVENT", "LabEvent",
+     "Admission includes laboratory test results", "1 admission : many lab events"),
+    ("Admission", "HAS_DIAGNOSIS", "Diagnosis",
+     "Admission has associated diagnoses", "1 admission : many diagnoses"),
+    ("Admission", "HAS_PROCEDURE", "Procedure",
+     "Admission has associated procedures", "1 admission : many procedures"),
+    ("Admission", "HAS_MEDICATION", "Medication",
+     "Admission has associated medications", "1 admission : many medications"),
+)
+
+# Natural language query caches: generated Cypher per question/limit/schema, and
+# query results reused for a short time per generated Cypher
+CYPHER_CACHE_MAX_ENTRIES: Final[int] = 1024
+QUERY_RESULT_CACHE_TTL: Final[float] = 60.0
+
+
+# System prompts for natural language queries, loaded from package resources on first use
+@functools.cache
+def natural_query_system_prompt() -> str:
+    """Return the system prompt used to generate Cypher from natural language."""
+    return resources.files(__package__).joinpath("prompts/natural_query.txt").read_text(encoding="utf-8")
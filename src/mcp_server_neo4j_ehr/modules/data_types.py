@@ -1,20 +1,17 @@
 """Data types and models for the Neo4j EHR MCP Server."""
 
+from dataclasses import dataclass
 from datetime import datetime
+from collections.abc import Mapping
 from typing import Optional, List, Dict, Any, Literal
-from pydantic import BaseModel, Field, ConfigDict, field_serializer
+import orjson
+from pydantic import BaseModel, Field, ConfigDict
 
 
-# Base class for all models with JSON serialization support
+# Base class for all models. Datetimes are left to Pydantic's native ISO 8601
+# handling (model_dump_json) and to orjson (to_json) rather than a per-field hook.
 class BaseNodeModel(BaseModel):
-    """Base model with datetime serialization support."""
-    
-    @field_serializer('*', mode='wrap')
-    def serialize_datetime(self, value, serializer):
-        """Serialize datetime fields to ISO format."""
-        if isinstance(value, datetime):
-            return value.isoformat() if value else None
-        return serializer(value)
+    """Base model for EHR nodes."""
 
 
 # Node Models
@@ -144,11 +141,22 @@ class NoteSearchResult(BaseNodeModel):
     note_type: str
     subject_id: Optional[str] = None
     hadm_id: Optional[str] = None
-    charttime: Optional[datetime] = None
+    charttime: Optional[str] = None  # ISO 8601, rendered by Cypher toString()
     text: str
     score: Optional[float] = None  # For semantic search
 
 
+@dataclass(slots=True)
+class NoteRow:
+    """Slotted, unvalidated note row for formatting results of our own queries."""
+    note_id: str
+    note_type: str
+    subject_id: Optional[str]
+    hadm_id: Optional[str]
+    charttime: Optional[str]
+    text: str
+
+
 class SchemaInfo(BaseNodeModel):
     """Schema information model."""
     nodes: List[Dict[str, Any]]
@@ -168,4 +176,56 @@ class ToolResponse(BaseNodeModel):
     success: bool
     data: Optional[Any] = None
     error: Optional[str] = None
-    format: OutputFormat = "json"
\ No newline at end of file
+    format: OutputFormat = "json"
+
+
+# JSON serialization
+def _json_default(value: Any) -> Any:
+    """orjson hook for types it does not handle natively (e.g. neo4j.time.DateTime)."""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, Mapping):  # e.g. read-only MappingProxyType
+        return dict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def cypher_projection(
+    model: type[BaseModel],
+    var: str,
+    expressions: Optional[Dict[str, str]] = None
+) -> str:
+    """Cypher map projection of node `var` limited to the model's fields.
+    
+    ``expressions`` supplies a Cypher expression for fields not returned as the
+    bare property, e.g. ``{"charttime": "toString(l.charttime)"}``.
+    """
+    expressions = expressions or {}
+    items = [
+        f"{field}: {expressions[field]}" if field in expressions else f".{field}"
+        for field in model.model_fields
+    ]
+    return f"{var} {{{', '.join(items)}}}"
+
+
+def json_row(model: type[BaseModel], node: Dict[str, Any]) -> Dict[str, Any]:
+    """Project node properties onto a model's fields for JSON output, without validation.
+    
+    Matches ``model(**node).model_dump(exclude_none=True)`` for well-typed nodes:
+    unknown properties and None values are dropped and Neo4j temporal values are
+    converted to their Python equivalents.
+    """
+    row = {}
+    for field in model.model_fields:
+        value = node.get(field)
+        if value is None:
+            continue
+        if hasattr(value, 'to_native'):
+            value = value.to_native()
+        row[field] = value
+    return row
+
+
+def to_json(obj: Any, indent: bool = False) -> str:
+    """Serialize tool output to a JSON string using orjson, optionally indented by 2."""
+    option = orjson.OPT_INDENT_2 if indent else 0
+    return orjson.dumps(obj, default=_json_default, option=option).decode()
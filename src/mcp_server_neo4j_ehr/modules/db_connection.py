@@ -1,289 +1,363 @@
 """Database connection management for Neo4j."""
 
+import asyncio
 import logging
-from typing import Optional, Dict, Any, List
-from neo4j import AsyncDriver, AsyncGraphDatabase, AsyncResult
-from neo4j.exceptions import Neo4jError
+import os
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import Optional, Dict, Any, AsyncIterator, List
+from neo4j import AsyncDriver, AsyncGraphDatabase, AsyncResult, AsyncSession, Query, READ_ACCESS, unit_of_work
+from neo4j.exceptions import DriverError, Neo4jError
+
+from .constants import (
+    DEFAULT_NEO4J_POOL_SIZE, DEFAULT_NEO4J_ACQ_TIMEOUT,
+    NEO4J_MAX_CONNECTION_LIFETIME, DEFAULT_QUERY_TIMEOUT, STREAM_READ_RETRIES, STREAM_READ_RETRY_DELAY
+)
 
 logger = logging.getLogger(__name__)
 
 
+# Hardcoded EHR schema, built once at import. Shared by every caller: do not mutate.
+_EHR_SCHEMA: Dict[str, Any] = {
+    "nodes": [
+        {
+            "label": "Patient",
+            "properties": [
+                "subject_id",  # unique, indexed
+                "gender",      # indexed
+                "anchor_age",
+                "anchor_year",
+                "anchor_year_group",
+                "dod"         # date of death
+            ],
+            "property_types": {
+                "subject_id": "string (unique, indexed)",
+                "gender": "string (indexed)",
+                "anchor_age": "integer",
+                "anchor_year": "integer", 
+                "anchor_year_group": "string",
+                "dod": "datetime"
+            }
+        },
+        {
+            "label": "Admission",
+            "properties": [
+                "hadm_id",            # unique, indexed
+                "admission_type",     # indexed
+                "admittime",
+                "dischtime",
+                "deathtime",
+                "admission_location",
+                "discharge_location",
+                "insurance",
+                "language",
+                "marital_status",
+                "race",
+                "edregtime",
+                "edouttime",
+                "hospital_expire_flag",
+                "admit_provider_id"
+            ],
+            "property_types": {
+                "hadm_id": "string (unique, indexed)",
+                "admission_type": "string (indexed)",
+                "admittime": "datetime",
+                "dischtime": "datetime",
+                "deathtime": "datetime",
+                "admission_location": "string",
+                "discharge_location": "string",
+                "insurance": "string",
+                "language": "string",
+                "marital_status": "string",
+                "race": "string",
+                "edregtime": "datetime",
+                "edouttime": "datetime",
+                "hospital_expire_flag": "integer",
+                "admit_provider_id": "string"
+            }
+        },
+        {
+            "label": "DischargeNote",
+            "properties": [
+                "note_id",       # unique, indexed
+                "hadm_id",       # indexed
+                "subject_id",    # indexed
+                "note_type",     # indexed
+                "text",          # indexed
+                "note_seq",
+                "charttime",
+                "storetime",
+                "embedding",
+                "embedding_model",
+                "embedding_created"
+            ],
+            "property_types": {
+                "note_id": "string (unique, indexed)",
+                "hadm_id": "string (indexed)",
+                "subject_id": "string (indexed)",
+                "note_type": "string (indexed)",
+                "text": "string (indexed)",
+                "note_seq": "integer",
+                "charttime": "datetime",
+                "storetime": "datetime",
+                "embedding": "float[]",
+                "embedding_model": "string",
+                "embedding_created": "datetime"
+            }
+        },
+        {
+            "label": "RadiologyReport",
+            "properties": [
+                "note_id",       # unique, indexed
+                "hadm_id",       # indexed
+                "subject_id",    # indexed
+                "note_type",     # indexed
+                "text",          # indexed
+                "note_seq",
+                "charttime",
+                "storetime",
+                "embedding",
+                "embedding_model",
+                "embedding_created"
+            ],
+            "property_types": {
+                "note_id": "string (unique, indexed)",
+                "hadm_id": "string (indexed)",
+                "subject_id": "string (indexed)",
+                "note_type": "string (indexed)",
+                "text": "string (indexed)",
+                "note_seq": "integer",
+                "charttime": "datetime",
+                "storetime": "datetime",
+                "embedding": "float[]",
+                "embedding_model": "string",
+                "embedding_created": "datetime"
+            }
+        },
+        {
+            "label": "LabEvent",
+            "properties": [
+                "lab_event_id",    # unique, indexed
+                "subject_id",      # indexed
+                "hadm_id",         # indexed
+                "charttime",       # indexed
+                "label",           # indexed
+                "itemid",          # indexed
+                "category",        # indexed
+                "flag",            # indexed
+                "value",           # indexed
+                "comments",        # indexed
+                "ref_range_upper",
+                "ref_range_lower",
+                "fluid",
+                "priority",
+                "storetime"
+            ],
+            "property_types": {
+                "lab_event_id": "string (unique, indexed)",
+                "subject_id": "string (indexed)",
+                "hadm_id": "string (indexed)",
+                "charttime": "datetime (indexed)",
+                "label": "string (indexed)",
+                "itemid": "string (indexed)",
+                "category": "string (indexed)",
+                "flag": "string (indexed)",
+                "value": "string (indexed)",
+                "comments": "string (indexed)",
+                "ref_range_upper": "float",
+                "ref_range_lower": "float",
+                "fluid": "string",
+                "priority": "string",
+                "storetime": "datetime"
+            }
+        },
+        {
+            "label": "Medication",
+            "properties": [
+                "medication",    # indexed
+                "route",         # indexed
+                "hadm_id",
+                "subject_id",
+                "frequency",
+                "verifiedtime"
+            ],
+            "property_types": {
+                "medication": "string (indexed)",
+                "route": "string (indexed)",
+                "hadm_id": "string",
+                "subject_id": "string",
+                "frequency": "string",
+                "verifiedtime": "datetime"
+            }
+        },
+        {
+            "label": "Diagnosis",
+            "properties": [
+                "icd_code",      # indexed
+                "long_title",    # indexed
+                "synonyms",      # indexed
+                "hadm_id",
+                "subject_id",
+                "seq_num",
+                "icd_version"
+            ],
+            "property_types": {
+                "icd_code": "string (indexed)",
+                "long_title": "string (indexed)",
+                "synonyms": "string[] (indexed)",
+                "hadm_id": "string",
+                "subject_id": "string",
+                "seq_num": "integer",
+                "icd_version": "integer"
+            }
+        },
+        {
+            "label": "Procedure",
+            "properties": [
+                "icd_code",      # indexed
+                "long_title",    # indexed
+                "hadm_id",
+                "seq_num",
+                "chartdate",
+                "icd_version"
+            ],
+            "property_types": {
+                "icd_code": "string (indexed)",
+                "long_title": "string (indexed)",
+                "hadm_id": "string",
+                "seq_num": "integer",
+                "chartdate": "datetime",
+                "icd_version": "integer"
+            }
+        }
+    ],
+    "relationships": [
+        {"relationshipType": "HAS_ADMISSION"},
+        {"relationshipType": "INCLUDES_DISCHARGE_NOTE"},
+        {"relationshipType": "INCLUDES_RADIOLOGY_REPORT"},
+        {"relationshipType": "INCLUDES_LAB_EVENT"},
+        {"relationshipType": "HAS_DIAGNOSIS"},
+        {"relationshipType": "HAS_PROCEDURE"},
+        {"relationshipType": "HAS_MEDICATION"}
+    ],
+    "constraints": [],  # Will be populated if needed
+    "indexes": []       # Will be populated if needed
+}
+
+
 class Neo4jConnection:
     """Manages Neo4j database connections and queries."""
     
-    def __init__(self, driver: AsyncDriver, database: str = "neo4j"):
+    def __init__(self, driver: AsyncDriver, database: str = "neo4j", uri: str = ""):
         self.driver = driver
         self.database = database
+        # Where the driver points; together with database, identifies the graph queried
+        self.uri = uri
+        # Server-side timeout applied to queries that don't pass their own
+        self.query_timeout = float(os.getenv("NEO4J_QUERY_TIMEOUT_S", DEFAULT_QUERY_TIMEOUT))
     
-    async def execute_read(self, query: str, parameters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
-        """Execute a read query and return results as a list of dictionaries."""
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        """Open a session on this connection's database for reuse across queries."""
+        async with self.driver.session(database=self.database) as session:
+            yield session
+    
+    async def execute_read(
+        self,
+        query: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        session: Optional[AsyncSession] = None,
+        timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """Execute a read query and return results as a list of dictionaries.
+        
+        Pass an open ``session`` to reuse it across several queries (e.g. in
+        one-shot scripts); otherwise a short-lived session is opened per call.
+        ``timeout`` (seconds) defaults to the connection's query_timeout.
+        """
+        work = _transaction_work(self._timeout(timeout))
         try:
+            if session is not None:
+                return await session.execute_read(work, query, parameters or {})
             async with self.driver.session(database=self.database) as session:
-                result = await session.execute_read(
-                    self._run_query, query, parameters or {}
-                )
+                result = await session.execute_read(work, query, parameters or {})
                 return result
         except Neo4jError as e:
             logger.error(f"Neo4j read error: {e}")
             raise
     
-    async def execute_write(self, query: str, parameters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    async def stream_read(
+        self,
+        query: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Execute a read query and yield records as dictionaries as they arrive.
+        
+        Runs as an auto-commit read so records can be consumed while the driver
+        is still fetching. Unlike execute_read's managed transaction, it can only
+        be retried until the first record is yielded: a retryable failure (a
+        transient error, a lost leader or connection) before then is retried up
+        to STREAM_READ_RETRIES times, one after that is raised to the caller.
+        Use execute_read where a fully retried read matters more than streaming.
+        """
+        for attempt in range(STREAM_READ_RETRIES + 1):
+            yielded = False
+            try:
+                async with self.driver.session(
+                    database=self.database, default_access_mode=READ_ACCESS
+                ) as session:
+                    result = await session.run(
+                        Query(query, timeout=self._timeout(timeout)), parameters or {}
+                    )
+                    async for record in result:
+                        yielded = True
+                        yield record.data()
+                return
+            except (Neo4jError, DriverError) as e:
+                if yielded or attempt == STREAM_READ_RETRIES or not e.is_retryable():
+                    logger.error(f"Neo4j read error: {e}")
+                    raise
+                logger.warning(f"Retrying streamed read after transient error: {e}")
+                await asyncio.sleep(STREAM_READ_RETRY_DELAY * 2 ** attempt)
+    
+    async def execute_write(
+        self,
+        query: str,
+        parameters: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
         """Execute a write query and return results as a list of dictionaries."""
+        work = _transaction_work(self._timeout(timeout))
         try:
             async with self.driver.session(database=self.database) as session:
-                result = await session.execute_write(
-                    self._run_query, query, parameters or {}
-                )
+                result = await session.execute_write(work, query, parameters or {})
                 return result
         except Neo4jError as e:
             logger.error(f"Neo4j write error: {e}")
             raise
     
-    @staticmethod
-    async def _run_query(tx, query: str, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Run a query within a transaction."""
-        result = await tx.run(query, parameters)
-        records = await result.data()
-        return records
+    def _timeout(self, timeout: Optional[float]) -> float:
+        """Resolve a per-call timeout against the connection default."""
+        return self.query_timeout if timeout is None else timeout
     
-    async def test_connection(self) -> bool:
+    async def test_connection(self, session: Optional[AsyncSession] = None) -> bool:
         """Test the database connection."""
         try:
-            await self.execute_read("RETURN 1 as test")
+            await self.execute_read("RETURN 1 as test", session=session)
             return True
         except Exception as e:
             logger.error(f"Connection test failed: {e}")
             return False
     
     async def get_schema(self) -> Dict[str, Any]:
-        """Get the database schema information - hardcoded for EHR data."""
-        schema = {
-            "nodes": [
-                {
-                    "label": "Patient",
-                    "properties": [
-                        "subject_id",  # unique, indexed
-                        "gender",      # indexed
-                        "anchor_age",
-                        "anchor_year",
-                        "anchor_year_group",
-                        "dod"         # date of death
-                    ],
-                    "property_types": {
-                        "subject_id": "string (unique, indexed)",
-                        "gender": "string (indexed)",
-                        "anchor_age": "integer",
-                        "anchor_year": "integer", 
-                        "anchor_year_group": "string",
-                        "dod": "datetime"
-                    }
-                },
-                {
-                    "label": "Admission",
-                    "properties": [
-                        "hadm_id",            # unique, indexed
-                        "admission_type",     # indexed
-                        "admittime",
-                        "dischtime",
-                        "deathtime",
-                        "admission_location",
-                        "discharge_location",
-                        "insurance",
-                        "language",
-                        "marital_status",
-                        "race",
-                        "edregtime",
-                        "edouttime",
-                        "hospital_expire_flag",
-                        "admit_provider_id"
-                    ],
-                    "property_types": {
-                        "hadm_id": "string (unique, indexed)",
-                        "admission_type": "string (indexed)",
-                        "admittime": "datetime",
-                        "dischtime": "datetime",
-                        "deathtime": "datetime",
-                        "admission_location": "string",
-                        "discharge_location": "string",
-                        "insurance": "string",
-                        "language": "string",
-                        "marital_status": "string",
-                        "race": "string",
-                        "edregtime": "datetime",
-                        "edouttime": "datetime",
-                        "hospital_expire_flag": "integer",
-                        "admit_provider_id": "string"
-                    }
-                },
-                {
-                    "label": "DischargeNote",
-                    "properties": [
-                        "note_id",       # unique, indexed
-                        "hadm_id",       # indexed
-                        "subject_id",    # indexed
-                        "note_type",     # indexed
-                        "text",          # indexed
-                        "note_seq",
-                        "charttime",
-                        "storetime",
-                        "embedding",
-                        "embedding_model",
-                        "embedding_created"
-                    ],
-                    "property_types": {
-                        "note_id": "string (unique, indexed)",
-                        "hadm_id": "string (indexed)",
-                        "subject_id": "string (indexed)",
-                        "note_type": "string (indexed)",
-                        "text": "string (indexed)",
-                        "note_seq": "integer",
-                        "charttime": "datetime",
-                        "storetime": "datetime",
-                        "embedding": "float[]",
-                        "embedding_model": "string",
-                        "embedding_created": "datetime"
-                    }
-                },
-                {
-                    "label": "RadiologyReport",
-                    "properties": [
-                        "note_id",       # unique, indexed
-                        "hadm_id",       # indexed
-                        "subject_id",    # indexed
-                        "note_type",     # indexed
-                        "text",          # indexed
-                        "note_seq",
-                        "charttime",
-                        "storetime",
-                        "embedding",
-                        "embedding_model",
-                        "embedding_created"
-                    ],
-                    "property_types": {
-                        "note_id": "string (unique, indexed)",
-                        "hadm_id": "string (indexed)",
-                        "subject_id": "string (indexed)",
-                        "note_type": "string (indexed)",
-                        "text": "string (indexed)",
-                        "note_seq": "integer",
-                        "charttime": "datetime",
-                        "storetime": "datetime",
-                        "embedding": "float[]",
-                        "embedding_model": "string",
-                        "embedding_created": "datetime"
-                    }
-                },
-                {
-                    "label": "LabEvent",
-                    "properties": [
-                        "lab_event_id",    # unique, indexed
-                        "subject_id",      # indexed
-                        "hadm_id",         # indexed
-                        "charttime",       # indexed
-                        "label",           # indexed
-                        "itemid",          # indexed
-                        "category",        # indexed
-                        "flag",            # indexed
-                        "value",           # indexed
-                        "comments",        # indexed
-                        "ref_range_upper",
-                        "ref_range_lower",
-                        "fluid",
-                        "priority",
-                        "storetime"
-                    ],
-                    "property_types": {
-                        "lab_event_id": "string (unique, indexed)",
-                        "subject_id": "string (indexed)",
-                        "hadm_id": "string (indexed)",
-                        "charttime": "datetime (indexed)",
-                        "label": "string (indexed)",
-                        "itemid": "string (indexed)",
-                        "category": "string (indexed)",
-                        "flag": "string (indexed)",
-                        "value": "string (indexed)",
-                        "comments": "string (indexed)",
-                        "ref_range_upper": "float",
-                        "ref_range_lower": "float",
-                        "fluid": "string",
-                        "priority": "string",
-                        "storetime": "datetime"
-                    }
-                },
-                {
-                    "label": "Medication",
-                    "properties": [
-                        "medication",    # indexed
-                        "route",         # indexed
-                        "hadm_id",
-                        "subject_id",
-                        "frequency",
-                        "verifiedtime"
-                    ],
-                    "property_types": {
-                        "medication": "string (indexed)",
-                        "route": "string (indexed)",
-                        "hadm_id": "string",
-                        "subject_id": "string",
-                        "frequency": "string",
-                        "verifiedtime": "datetime"
-                    }
-                },
-                {
-                    "label": "Diagnosis",
-                    "properties": [
-                        "icd_code",      # indexed
-                        "long_title",    # indexed
-                        "synonyms",      # indexed
-                        "hadm_id",
-                        "subject_id",
-                        "seq_num",
-                        "icd_version"
-                    ],
-                    "property_types": {
-                        "icd_code": "string (indexed)",
-                        "long_title": "string (indexed)",
-                        "synonyms": "string[] (indexed)",
-                        "hadm_id": "string",
-                        "subject_id": "string",
-                        "seq_num": "integer",
-                        "icd_version": "integer"
-                    }
-                },
-                {
-                    "label": "Procedure",
-                    "properties": [
-                        "icd_code",      # indexed
-                        "long_title",    # indexed
-                        "hadm_id",
-                        "seq_num",
-                        "chartdate",
-                        "icd_version"
-                    ],
-                    "property_types": {
-                        "icd_code": "string (indexed)",
-                        "long_title": "string (indexed)",
-                        "hadm_id": "string",
-                        "seq_num": "integer",
-                        "chartdate": "datetime",
-                        "icd_version": "integer"
-                    }
-                }
-            ],
-            "relationships": [
-                {"relationshipType": "HAS_ADMISSION"},
-                {"relationshipType": "INCLUDES_DISCHARGE_NOTE"},
-                {"relationshipType": "INCLUDES_RADIOLOGY_REPORT"},
-                {"relationshipType": "INCLUDES_LAB_EVENT"},
-                {"relationshipType": "HAS_DIAGNOSIS"},
-                {"relationshipType": "HAS_PROCEDURE"},
-                {"relationshipType": "HAS_MEDICATION"}
-            ],
-            "constraints": [],  # Will be populated if needed
-            "indexes": []       # Will be populated if needed
-        }
+        """Get the database schema information - hardcoded for EHR data.
         
-        return schema
+        The returned dict is shared between callers and must not be mutated;
+        renderings of it are memoized on its identity, so a new dict is the
+        signal that it changed.
+        """
+        return _EHR_SCHEMA
     
     async def close(self):
         """Close the database connection."""
@@ -291,6 +365,29 @@ class Neo4jConnection:
             await self.driver.close()
 
 
+async def _run_query(tx, query: str, parameters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Run a query within a transaction."""
+    result = await tx.run(query, parameters)
+    records = await result.data()
+    return records
+
+
+@lru_cache(maxsize=None)
+def _transaction_work(timeout: float):
+    """Return _run_query wrapped to run its transaction with a server-side timeout."""
+    return unit_of_work(timeout=timeout)(_run_query)
+
+
 def create_neo4j_driver(uri: str, username: str, password: str) -> AsyncDriver:
-    """Create a Neo4j async driver instance."""
-    return AsyncGraphDatabase.driver(uri, auth=(username, password))
\ No newline at end of file
+    """Create a Neo4j async driver instance.
+    
+    Create one driver per process and share it: its connection pool is sized by
+    NEO4J_POOL_SIZE and waits up to NEO4J_ACQ_TIMEOUT seconds for a free connection.
+    """
+    return AsyncGraphDatabase.driver(
+        uri,
+        auth=(username, password),
+        max_connection_pool_size=int(os.getenv("NEO4J_POOL_SIZE", DEFAULT_NEO4J_POOL_SIZE)),
+        connection_acquisition_timeout=float(os.getenv("NEO4J_ACQ_TIMEOUT", DEFAULT_NEO4J_ACQ_TIMEOUT)),
+        max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME
+    )
\ No newline at end of file
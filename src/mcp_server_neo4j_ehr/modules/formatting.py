@@ -0,0 +1,129 @@
+"""Plain-text table rendering and output helpers shared by the output formatters."""
+
+from io import StringIO
+from typing import Any, AsyncIterable, Callable, Dict, List, Sequence
+
+from .data_types import json_row, to_json
+from .constants import OUTPUT_FORMAT_TABLE
+
+
+def _is_number(cell: str) -> bool:
+    try:
+        float(cell)
+    except ValueError:
+        return False
+    return True
+
+
+def render_grid(rows: Sequence[Sequence[Any]], headers: Sequence[str]) -> str:
+    """Render rows as a grid table, in the layout of tabulate's "grid" format.
+
+    Cells are converted with str() (None renders empty) and stripped of
+    surrounding whitespace, and cells containing newlines span several lines.
+    Columns whose non-empty cells are all numbers are right-aligned; every
+    other column is left-aligned. Values are shown as given.
+    """
+    split_rows: List[List[List[str]]] = [
+        [("" if cell is None else str(cell)).strip().split("\n") for cell in row] for row in rows
+    ]
+
+    right = [
+        any(split_row[i] != [""] for split_row in split_rows) and all(
+            len(split_row[i]) == 1 and (not split_row[i][0] or _is_number(split_row[i][0]))
+            for split_row in split_rows
+        )
+        for i in range(len(headers))
+    ]
+
+    # Headers get two characters of slack, as tabulate gives them
+    widths = [len(h) + 2 for h in headers]
+    for split_row in split_rows:
+        for i, lines in enumerate(split_row):
+            for line in lines:
+                if len(line) > widths[i]:
+                    widths[i] = len(line)
+
+    def cell(text: str, i: int) -> str:
+        return f"{text:>{widths[i]}}" if right[i] else f"{text:<{widths[i]}}"
+
+    border = "+" + "+".join("-" * (w + 2) for w in widths) + "+\n"
+    out = StringIO()
+    out.write(border)
+    out.write("| " + " | ".join(cell(h, i) for i, h in enumerate(headers)) + " |\n")
+    out.write("+" + "+".join("=" * (w + 2) for w in widths) + "+\n")
+    for split_row in split_rows:
+        height = max((len(lines) for lines in split_row), default=1)
+        for n in range(height):
+            out.write("| " + " | ".join(
+                cell(lines[n] if n < len(lines) else "", i) for i, lines in enumerate(split_row)
+            ) + " |\n")
+        out.write(border)
+    if not split_rows:
+        out.write(border)
+    return out.getvalue().rstrip("\n")
+
+
+async def format_rows(
+    records: AsyncIterable[Dict[str, Any]],
+    column: str,
+    model: type,
+    key: str,
+    format_table: Callable[[list], str],
+    format: str
+) -> str:
+    """Format the rows of a list query as they stream in.
+    
+    Each record holds one row under ``column``. Rows are converted as they
+    arrive, not after the whole result is buffered; JSON output goes straight
+    from the row properties, skipping the model.
+    """
+    as_json = format != OUTPUT_FORMAT_TABLE
+    rows = [
+        json_row(model, record[column]) if as_json else model(**record[column])
+        async for record in records
+    ]
+    
+    if not rows:
+        return to_json({key: [], "message": f"No {key.replace('_', ' ')} found"})
+    
+    if as_json:
+        return to_json({key: rows, "count": len(rows)})
+    
+    return format_table(rows)
+
+
+def render_patient_sections(tables: Dict[str, str]) -> str:
+    """Join per-patient tables, each under a PATIENT heading."""
+    return "\n\n".join(f"PATIENT {patient_id}\n{table}" for patient_id, table in tables.items())
+
+
+def format_by_patient(
+    patient_ids: Sequence[str],
+    results: List[Dict[str, Any]],
+    model: type,
+    key: str,
+    format_table: Callable[[list], str],
+    format: str
+) -> str:
+    """Format the rows of a batched list query, grouped by patient.
+    
+    Each result holds a patient ID (``pid``) and that patient's ``rows``; patients
+    without rows are included with none. Table output has a section per patient,
+    JSON output maps patient IDs to their rows under ``key``.
+    """
+    by_patient: Dict[str, list] = {patient_id: [] for patient_id in patient_ids}
+    for result in results:
+        by_patient[result['pid']] = result['rows']
+    
+    if format == OUTPUT_FORMAT_TABLE:
+        return render_patient_sections({
+            patient_id: format_table([model(**row) for row in rows])
+            for patient_id, rows in by_patient.items()
+        })
+    return to_json({
+        key: {
+            patient_id: [json_row(model, row) for row in rows]
+            for patient_id, rows in by_patient.items()
+        },
+        "count": sum(len(rows) for rows in by_patient.values())
+    })
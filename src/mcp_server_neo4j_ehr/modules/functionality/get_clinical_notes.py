@@ -1,62 +1,158 @@
 """Get clinical notes functionality."""
 
-import json
+import asyncio
+import heapq
 import logging
-from typing import Optional, List
-from tabulate import tabulate
+from io import StringIO
+from itertools import islice, product
+from typing import Any, AsyncIterator, Dict, Optional, List
 
 from ..db_connection import Neo4jConnection
-from ..data_types import NoteSearchResult, OutputFormat, NoteType
+from ..formatting import render_grid
+from ..data_types import NoteRow, OutputFormat, NoteType, to_json
 from ..constants import (
     OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_TEXT,
-    NOTE_TYPE_DISCHARGE, NOTE_TYPE_RADIOLOGY, NOTE_TYPE_ALL
+    NOTE_TYPE_DISCHARGE, NOTE_TYPE_RADIOLOGY, NOTE_TYPE_ALL, NOTES_QUERY_TIMEOUT
 )
 
 logger = logging.getLogger(__name__)
 
 
-async def get_clinical_notes(
-    db: Neo4jConnection,
-    note_type: NoteType = NOTE_TYPE_ALL,
-    limit: int = 10,
-    patient_id: Optional[str] = None,
-    admission_id: Optional[str] = None,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
-) -> str:
-    """Retrieve clinical notes by type and patient/admission."""
+# Rule printed above each note in text output
+_NOTE_SEPARATOR = "=" * 80
+
+# Characters of note text shown in table output
+TABLE_TEXT_PREVIEW = 100
+
+# The only note properties ever returned. Notes also carry an `embedding` vector
+# (1536 floats), so queries list fields explicitly and never `RETURN note`.
+NOTE_SAFE_FIELDS = ("note_id", "note_type", "subject_id", "hadm_id", "charttime", "text")
+
+# Cypher expressions for fields not returned as the bare property
+_NOTE_FIELD_EXPRESSIONS = {
+    "charttime": "toString(note.charttime)",
+}
+
+# Extra column carrying the raw charttime, which merges across labels compare.
+# The ISO string drops zero seconds and may carry an offset, so it doesn't sort.
+_SORT_FIELD = "_sort"
+
+# Node label holding each note type
+_NOTE_LABELS = {
+    NOTE_TYPE_DISCHARGE: "DischargeNote",
+    NOTE_TYPE_RADIOLOGY: "RadiologyReport",
+}
+
+
+def _build_notes_query(note_type: str, has_patient: bool, has_admission: bool, preview: bool) -> str:
+    """Build the clinical notes query for one note type and filter combination.
+    
+    Each note type is matched by label so the planner uses a label scan (and the
+    per-label subject_id/hadm_id indexes) rather than scanning all nodes. With
+    preview set, only enough text for the table preview (plus one character, so
+    the formatter can tell whether to add an ellipsis) leaves the database.
+    """
     
     # Build WHERE conditions
     where_conditions = []
     
-    # Note type filter
-    if note_type == NOTE_TYPE_DISCHARGE:
-        where_conditions.append("note:DischargeNote")
-    elif note_type == NOTE_TYPE_RADIOLOGY:
-        where_conditions.append("note:RadiologyReport")
-    else:
-        where_conditions.append("(note:DischargeNote OR note:RadiologyReport)")
-    
     # Patient filter
-    if patient_id:
+    if has_patient:
         where_conditions.append("note.subject_id = $patient_id")
     
     # Admission filter
-    if admission_id:
+    if has_admission:
         where_conditions.append("note.hadm_id = $admission_id")
     
-    # Build query
-    cypher_query = f"""
-    MATCH (note)
-    WHERE {' AND '.join(where_conditions) if where_conditions else 'true'}
-    RETURN note.note_id as note_id,
-           note.note_type as note_type,
-           note.subject_id as subject_id,
-           note.hadm_id as hadm_id,
-           note.charttime as charttime,
-           note.text as text
+    where = f" WHERE {' AND '.join(where_conditions)}" if where_conditions else ""
+    
+    expressions = dict(_NOTE_FIELD_EXPRESSIONS)
+    if preview:
+        expressions["text"] = f"substring(note.text, 0, {TABLE_TEXT_PREVIEW + 1})"
+    projection = ",\n           ".join(
+        f"{expressions.get(field, f'note.{field}')} as {field}" for field in NOTE_SAFE_FIELDS
+    )
+    
+    query = f"""
+    MATCH (note:{_NOTE_LABELS[note_type]}){where}
+    RETURN {projection},
+           note.charttime as {_SORT_FIELD}
     ORDER BY note.charttime DESC
     LIMIT $limit
     """
+    assert "embedding" not in query.lower(), "note queries must not return embeddings"
+    return query
+
+
+# Every (note type, has patient filter, has admission filter, preview) query, built
+# once. Filter values always travel as parameters, so each text maps to one cached plan.
+_NOTES_QUERIES = {
+    key: _build_notes_query(*key)
+    for key in product(_NOTE_LABELS, (False, True), (False, True), (False, True))
+}
+
+
+async def _fetch_notes(db: Neo4jConnection, cypher_query: str, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Collect the rows of one notes query."""
+    return [r async for r in _stream_notes(db, cypher_query, params)]
+
+
+def _stream_notes(db: Neo4jConnection, cypher_query: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+    """Stream the rows of one notes query as they arrive."""
+    return db.stream_read(cypher_query, params, timeout=NOTES_QUERY_TIMEOUT)
+
+
+def _charttime_desc_key(row: Dict[str, Any]) -> tuple:
+    """Merge key matching Neo4j's ORDER BY charttime DESC, which puts null first."""
+    charttime = row[_SORT_FIELD]
+    return (charttime is None, charttime)
+
+
+async def _note_rows(
+    db: Neo4jConnection,
+    queries: List[str],
+    params: Dict[str, Any],
+    limit: int
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield note rows newest-first across the given per-label queries."""
+    if len(queries) == 1:
+        async for row in _stream_notes(db, queries[0], params):
+            row.pop(_SORT_FIELD, None)
+            yield row
+        return
+    
+    # Query each label concurrently (one session each), then merge the
+    # already newest-first results and keep the overall top `limit`
+    per_label = await asyncio.gather(*(_fetch_notes(db, q, params) for q in queries))
+    for row in islice(
+        heapq.merge(*per_label, key=_charttime_desc_key, reverse=True),
+        limit
+    ):
+        row.pop(_SORT_FIELD, None)
+        yield row
+
+
+async def stream_clinical_notes(
+    db: Neo4jConnection,
+    note_type: NoteType = NOTE_TYPE_ALL,
+    limit: int = 10,
+    patient_id: Optional[str] = None,
+    admission_id: Optional[str] = None,
+    format: OutputFormat = OUTPUT_FORMAT_JSON
+) -> AsyncIterator[str]:
+    """Yield clinical notes output in chunks that concatenate to get_clinical_notes' result.
+    
+    JSON output is yielded one note at a time as rows arrive from a single-label
+    query. Table and text output depend on every row (column widths, note count),
+    so those rows are collected first and then yielded per note where possible.
+    """
+    
+    # Pick the prebuilt query for each note type requested
+    note_types = [note_type] if note_type in _NOTE_LABELS else list(_NOTE_LABELS)
+    queries = [
+        _NOTES_QUERIES[(t, bool(patient_id), bool(admission_id), format == OUTPUT_FORMAT_TABLE)]
+        for t in note_types
+    ]
     
     params = {
         "patient_id": patient_id,
@@ -64,57 +160,85 @@ async def get_clinical_notes(
         "limit": limit
     }
     
-    results = await db.execute_read(cypher_query, params)
-    
-    # Convert Neo4j DateTime objects to Python datetime
-    converted_results = []
-    for r in results:
-        if 'charttime' in r and hasattr(r['charttime'], 'to_native'):
-            r['charttime'] = r['charttime'].to_native()
-        converted_results.append(NoteSearchResult(**r))
-    
-    # Format output
+    # charttime already arrives as an ISO 8601 string from toString().
+    # Rows come straight from our own query, so the table/text paths use
+    # slotted NoteRows and the JSON path skips row objects entirely.
+    rows = _note_rows(db, queries, params, limit)
     if format == OUTPUT_FORMAT_TABLE:
-        return format_notes_as_table(converted_results)
+        yield format_notes_as_table([NoteRow(**r) async for r in rows])
     elif format == OUTPUT_FORMAT_TEXT:
-        return format_notes_as_text(converted_results)
+        notes = [NoteRow(**r) async for r in rows]
+        if not notes:
+            yield "No notes found."
+        for i, note in enumerate(notes, 1):
+            yield _format_note_text(note, i, len(notes))
     else:
-        return json.dumps([r.model_dump(exclude_none=True) for r in converted_results])
+        yield "["
+        sep = ""
+        async for r in rows:
+            yield sep + to_json({k: v for k, v in r.items() if v is not None})
+            sep = ","
+        yield "]"
 
 
-def format_notes_as_table(results: List[NoteSearchResult]) -> str:
+async def get_clinical_notes(
+    db: Neo4jConnection,
+    note_type: NoteType = NOTE_TYPE_ALL,
+    limit: int = 10,
+    patient_id: Optional[str] = None,
+    admission_id: Optional[str] = None,
+    format: OutputFormat = OUTPUT_FORMAT_JSON
+) -> str:
+    """Retrieve clinical notes by type and patient/admission."""
+    return "".join([
+        chunk async for chunk in stream_clinical_notes(
+            db, note_type, limit, patient_id, admission_id, format
+        )
+    ])
+
+
+def format_notes_as_table(results: List[NoteRow]) -> str:
     """Format notes as a table."""
     if not results:
         return "No notes found."
     
-    table_data = []
-    for note in results:
-        table_data.append([
+    table_data = [
+        [
             note.note_id,
             note.note_type,
             note.subject_id or "N/A",
             note.hadm_id or "N/A",
             str(note.charttime) if note.charttime else "N/A",
-            note.text[:100] + "..." if len(note.text) > 100 else note.text
-        ])
+            note.text[:TABLE_TEXT_PREVIEW] + "..." if len(note.text) > TABLE_TEXT_PREVIEW else note.text
+        ]
+        for note in results
+    ]
     
     headers = ["Note ID", "Type", "Patient ID", "Admission ID", "Chart Time", "Text Preview"]
-    return tabulate(table_data, headers=headers, tablefmt="grid")
+    return render_grid(table_data, headers)
 
 
-def format_notes_as_text(results: List[NoteSearchResult]) -> str:
+def format_notes_as_text(results: List[NoteRow]) -> str:
     """Format notes as plain text."""
     if not results:
         return "No notes found."
     
-    output = []
-    for i, note in enumerate(results, 1):
-        output.append(f"\n{'='*80}")
-        output.append(f"Note {i}/{len(results)} - ID: {note.note_id}")
-        output.append(f"Type: {note.note_type}")
-        output.append(f"Patient: {note.subject_id or 'N/A'}, Admission: {note.hadm_id or 'N/A'}")
-        if note.charttime:
-            output.append(f"Chart Time: {note.charttime}")
-        output.append(f"\n{note.text}")
-    
-    return "\n".join(output)
\ No newline at end of file
+    total = len(results)
+    return "".join(_format_note_text(note, i, total) for i, note in enumerate(results, 1))
+
+
+def _format_note_text(note: NoteRow, i: int, total: int) -> str:
+    """Format the i-th of `total` notes as plain text."""
+    buf = StringIO()
+    w = buf.write
+    if i > 1:
+        w("\n")
+    w(f"\n{_NOTE_SEPARATOR}\n")
+    w(f"Note {i}/{total} - ID: {note.note_id}\n")
+    w(f"Type: {note.note_type}\n")
+    w(f"Patient: {note.subject_id or 'N/A'}, Admission: {note.hadm_id or 'N/A'}\n")
+    if note.charttime:
+        w(f"Chart Time: {note.charttime}\n")
+    w("\n")
+    w(note.text)
+    return buf.getvalue()
@@ -1,25 +1,51 @@
 """Get database schema functionality."""
 
-import json
-from datetime import datetime
-from typing import Dict, Any
+from io import StringIO
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Tuple
 
 from ..db_connection import Neo4jConnection
-from ..data_types import OutputFormat
-from ..constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_MARKDOWN
+from ..data_types import OutputFormat, to_json
+from ..constants import EHR_RELATIONSHIPS, OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_MARKDOWN
 
 
-def convert_neo4j_types(obj):
-    """Convert Neo4j types to JSON-serializable types."""
-    if isinstance(obj, dict):
-        return {k: convert_neo4j_types(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_neo4j_types(item) for item in obj]
-    elif hasattr(obj, 'isoformat'):  # Handles neo4j.time.DateTime and python datetime
-        return obj.isoformat()
-    elif hasattr(obj, '__dict__'):  # Handle Neo4j objects
-        return convert_neo4j_types(obj.__dict__)
-    return obj
+# Known relationship structure, appended to the schema returned by the database.
+# Read-only, since every schema rendering shares the same objects.
+KNOWN_RELATIONSHIPS = tuple(
+    MappingProxyType({"from": from_label, "to": to_label, "type": rel_type, "description": description})
+    for from_label, rel_type, to_label, description, _ in EHR_RELATIONSHIPS
+)
+
+# Fixed opening and closing sections of the markdown schema
+_MD_HEADER = "# Neo4j EHR Database Schema\n\n## Node Types\n\n"
+_MD_EXAMPLES = """
+## Example Queries
+
+### Get patient with all admissions
+```cypher
+MATCH (p:Patient {subject_id: '10000032'})-[:HAS_ADMISSION]->(a:Admission)
+RETURN p, collect(a) as admissions
+```
+
+### Find discharge notes mentioning a condition
+```cypher
+MATCH (d:DischargeNote)
+WHERE toLower(d.text) CONTAINS 'heart failure'
+RETURN d.note_id, d.subject_id, d.hadm_id
+LIMIT 10
+```
+
+### Get abnormal lab results for a patient
+```cypher
+MATCH (l:LabEvent)
+WHERE l.subject_id = '10000032' AND l.flag IS NOT NULL AND l.flag <> 'normal'
+RETURN l.label, l.value, l.flag, l.charttime
+ORDER BY l.charttime DESC
+```"""
+
+# Rendering of the last schema seen, per output format. The connection hands back
+# the same dict on every call, so object identity is a safe key.
+_schema_text_cache: Dict[str, Tuple[Dict[str, Any], str]] = {}
 
 
 async def get_schema(
@@ -29,122 +55,85 @@ async def get_schema(
     """Get the database schema."""
     
     # Get schema from database
-    schema = await db.get_schema()
-    
-    # Add our known relationship structure
-    schema["known_relationships"] = [
-        {
-            "from": "Patient",
-            "to": "Admission",
-            "type": "HAS_ADMISSION",
-            "description": "Patient has hospital admissions"
-        },
-        {
-            "from": "Admission",
-            "to": "DischargeNote",
-            "type": "INCLUDES_DISCHARGE_NOTE",
-            "description": "Admission includes discharge summary notes"
-        },
-        {
-            "from": "Admission",
-            "to": "RadiologyReport",
-            "type": "INCLUDES_RADIOLOGY_REPORT",
-            "description": "Admission includes radiology reports"
-        },
-        {
-            "from": "Admission",
-            "to": "LabEvent",
-            "type": "INCLUDES_LAB_EVENT",
-            "description": "Admission includes laboratory test results"
-        },
-        {
-            "from": "Admission",
-            "to": "Diagnosis",
-            "type": "HAS_DIAGNOSIS",
-            "description": "Admission has associated diagnoses"
-        },
-        {
-            "from": "Admission",
-            "to": "Procedure",
-            "type": "HAS_PROCEDURE",
-            "description": "Admission has associated procedures"
-        },
-        {
-            "from": "Admission",
-            "to": "Medication",
-            "type": "HAS_MEDICATION",
-            "description": "Admission has associated medications"
-        }
-    ]
+    db_schema = await db.get_schema()
     
     # Format output
     if format == OUTPUT_FORMAT_MARKDOWN:
-        return format_schema_as_markdown(schema)
+        return _memoized(
+            OUTPUT_FORMAT_MARKDOWN, db_schema,
+            lambda s: format_schema_as_markdown(with_known_relationships(s))
+        )
     else:
-        # Convert Neo4j types to JSON-serializable types
-        schema_serializable = convert_neo4j_types(schema)
-        return json.dumps(schema_serializable, indent=2)
+        return format_schema_as_json(db_schema)
+
+
+async def prewarm_schema_cache(db: Neo4jConnection) -> None:
+    """Fetch the schema and render both output formats ahead of the first request."""
+    for format in (OUTPUT_FORMAT_MARKDOWN, OUTPUT_FORMAT_JSON):
+        await get_schema(db, format)
+
+
+def _memoized(key: str, db_schema: Dict[str, Any], render: Callable[[Dict[str, Any]], str]) -> str:
+    """Render the schema, reusing the last rendering under key while the schema is unchanged."""
+    cached = _schema_text_cache.get(key)
+    if cached is not None and cached[0] is db_schema:
+        return cached[1]
+    text = render(db_schema)
+    _schema_text_cache[key] = (db_schema, text)
+    return text
+
+
+def with_known_relationships(db_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Return a copy of the database schema extended with the known relationships."""
+    return {**db_schema, "known_relationships": KNOWN_RELATIONSHIPS}
+
+
+def format_schema_as_json(db_schema: Dict[str, Any]) -> str:
+    """Serialize the schema to JSON, reusing the result while the schema is unchanged."""
+    # orjson serializes Neo4j temporal values and read-only mappings via to_json's hook
+    return _memoized(
+        OUTPUT_FORMAT_JSON, db_schema,
+        lambda s: to_json(with_known_relationships(s), indent=True)
+    )
 
 
 def format_schema_as_markdown(schema: Dict[str, Any]) -> str:
     """Format schema as markdown."""
-    lines = []
+    buf = StringIO()
+    w = buf.write
     
-    lines.append("# Neo4j EHR Database Schema\n")
+    w(_MD_HEADER)
     
     # Node types
-    lines.append("## Node Types\n")
     for node in schema.get("nodes", []):
         label = node.get("label", "Unknown")
         properties = node.get("properties", [])
-        lines.append(f"### {label}")
-        lines.append(f"**Properties:** {', '.join(properties)}\n")
+        w(f"### {label}\n**Properties:** {', '.join(properties)}\n\n")
     
     # Relationships
-    lines.append("## Relationships\n")
+    w("## Relationships\n\n")
     for rel in schema.get("known_relationships", []):
-        lines.append(f"### {rel['type']}")
-        lines.append(f"- **From:** {rel['from']}")
-        lines.append(f"- **To:** {rel['to']}")
-        lines.append(f"- **Description:** {rel['description']}\n")
+        w(f"### {rel['type']}\n")
+        w(f"- **From:** {rel['from']}\n")
+        w(f"- **To:** {rel['to']}\n")
+        w(f"- **Description:** {rel['description']}\n\n")
     
     # Indexes
     if schema.get("indexes"):
-        lines.append("## Indexes\n")
+        w("## Indexes\n\n")
         for idx in schema["indexes"]:
             name = idx.get("name", "Unknown")
             state = idx.get("state", "Unknown")
-            lines.append(f"- {name} (State: {state})")
+            w(f"- {name} (State: {state})\n")
     
     # Constraints
     if schema.get("constraints"):
-        lines.append("\n## Constraints\n")
+        w("\n## Constraints\n\n")
         for constraint in schema["constraints"]:
             name = constraint.get("name", "Unknown")
-            lines.append(f"- {name}")
+            w(f"- {name}\n")
     
     # Usage examples
-    lines.append("\n## Example Queries\n")
-    lines.append("### Get patient with all admissions")
-    lines.append("```cypher")
-    lines.append("MATCH (p:Patient {subject_id: '10000032'})-[:HAS_ADMISSION]->(a:Admission)")
-    lines.append("RETURN p, collect(a) as admissions")
-    lines.append("```\n")
-    
-    lines.append("### Find discharge notes mentioning a condition")
-    lines.append("```cypher")
-    lines.append("MATCH (d:DischargeNote)")
-    lines.append("WHERE toLower(d.text) CONTAINS 'heart failure'")
-    lines.append("RETURN d.note_id, d.subject_id, d.hadm_id")
-    lines.append("LIMIT 10")
-    lines.append("```\n")
-    
-    lines.append("### Get abnormal lab results for a patient")
-    lines.append("```cypher")
-    lines.append("MATCH (l:LabEvent)")
-    lines.append("WHERE l.subject_id = '10000032' AND l.flag IS NOT NULL AND l.flag <> 'normal'")
-    lines.append("RETURN l.label, l.value, l.flag, l.charttime")
-    lines.append("ORDER BY l.charttime DESC")
-    lines.append("```")
+    w(_MD_EXAMPLES)
     
-    return "\n".join(lines)
\ No newline at end of file
+    return buf.getvalue()
@@ -1,12 +1,46 @@
 """List diagnoses functionality."""
 
-import json
-from typing import Optional
-from tabulate import tabulate
+from typing import List, Optional
 
 from ..db_connection import Neo4jConnection
-from ..data_types import Diagnosis, OutputFormat
-from ..constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE
+from ..formatting import format_by_patient, format_rows, render_grid
+from ..data_types import Diagnosis, OutputFormat, cypher_projection, to_json
+from ..constants import OUTPUT_FORMAT_JSON
+
+
+# Only the Diagnosis fields are returned, not the whole node
+_PROJECTION = cypher_projection(Diagnosis, "d")
+
+# By patient, each row carries the ID of the admission it was found through
+_PATIENT_PROJECTION = cypher_projection(Diagnosis, "d", {"hadm_id": "a.hadm_id"})
+
+_ADMISSION_QUERY = f"""
+    MATCH (a:Admission {{hadm_id: $admission_id}})-[:HAS_DIAGNOSIS]->(d:Diagnosis)
+    RETURN {_PROJECTION} AS d
+    ORDER BY d.seq_num
+    LIMIT $limit
+"""
+
+_PATIENT_QUERY = f"""
+    MATCH (p:Patient {{subject_id: $patient_id}})-[:HAS_ADMISSION]->(a:Admission)-[:HAS_DIAGNOSIS]->(d:Diagnosis)
+    RETURN {_PATIENT_PROJECTION} AS d
+    ORDER BY a.admittime DESC, d.seq_num
+    LIMIT $limit
+"""
+
+# Several patients in one round-trip; the subquery stops at $limit rows per patient
+_PATIENTS_QUERY = f"""
+    UNWIND $patient_ids AS pid
+    CALL {{
+        WITH pid
+        MATCH (p:Patient {{subject_id: pid}})-[:HAS_ADMISSION]->(a:Admission)-[:HAS_DIAGNOSIS]->(d:Diagnosis)
+        WITH a, d
+        ORDER BY a.admittime DESC, d.seq_num
+        LIMIT $limit
+        RETURN {_PATIENT_PROJECTION} AS row
+    }}
+    RETURN pid, collect(row) AS rows
+"""
 
 
 async def list_diagnoses(
@@ -14,55 +48,37 @@ async def list_diagnoses(
     patient_id: Optional[str] = None,
     admission_id: Optional[str] = None,
     limit: int = 20,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
 ) -> str:
-    """List diagnoses for a patient or admission."""
+    """List diagnoses for a patient or admission.
+    
+    With ``patient_ids``, diagnoses for all those patients are fetched in one
+    query and grouped by patient, up to ``limit`` per patient; ``admission_id``
+    cannot be combined with it.
+    """
+    
+    if patient_ids:
+        if admission_id:
+            return to_json({"error": "admission_id cannot be combined with patient_ids"})
+        results = await db.execute_read(_PATIENTS_QUERY, {"patient_ids": patient_ids, "limit": limit})
+        return format_by_patient(
+            patient_ids, results, Diagnosis, "diagnoses", format_diagnoses_as_table, format
+        )
     
     # Build query based on filters
     if admission_id:
-        query = """
-        MATCH (a:Admission {hadm_id: $admission_id})-[:HAS_DIAGNOSIS]->(d:Diagnosis)
-        RETURN d
-        ORDER BY d.seq_num
-        LIMIT $limit
-        """
+        query = _ADMISSION_QUERY
         params = {"admission_id": admission_id, "limit": limit}
     elif patient_id:
-        query = """
-        MATCH (p:Patient {subject_id: $patient_id})-[:HAS_ADMISSION]->(a:Admission)-[:HAS_DIAGNOSIS]->(d:Diagnosis)
-        RETURN d, a.hadm_id as hadm_id
-        ORDER BY a.admittime DESC, d.seq_num
-        LIMIT $limit
-        """
+        query = _PATIENT_QUERY
         params = {"patient_id": patient_id, "limit": limit}
     else:
-        return json.dumps({"error": "Either patient_id or admission_id must be provided"})
+        return to_json({"error": "Either patient_id or admission_id must be provided"})
     
-    results = await db.execute_read(query, params)
-    
-    if not results:
-        return json.dumps({"diagnoses": [], "message": "No diagnoses found"})
-    
-    # Process results
-    diagnoses = []
-    for result in results:
-        diagnosis_data = result['d']
-        diagnosis = Diagnosis(**diagnosis_data)
-        
-        # Add admission ID if querying by patient
-        if patient_id and 'hadm_id' in result:
-            diagnosis.hadm_id = result['hadm_id']
-        
-        diagnoses.append(diagnosis)
-    
-    # Format output
-    if format == OUTPUT_FORMAT_TABLE:
-        return format_diagnoses_as_table(diagnoses)
-    else:
-        return json.dumps({
-            "diagnoses": [d.model_dump(exclude_none=True) for d in diagnoses],
-            "count": len(diagnoses)
-        })
+    return await format_rows(
+        db.stream_read(query, params), "d", Diagnosis, "diagnoses", format_diagnoses_as_table, format
+    )
 
 
 def format_diagnoses_as_table(diagnoses: list[Diagnosis]) -> str:
@@ -81,4 +97,4 @@ def format_diagnoses_as_table(diagnoses: list[Diagnosis]) -> str:
         ])
     
     headers = ["ICD Code", "Description", "Admission ID", "Sequence", "Version"]
-    return tabulate(table_data, headers=headers, tablefmt="grid")
\ No newline at end of file
+    return render_grid(table_data, headers)
\ No newline at end of file
@@ -1,45 +1,119 @@
 """List lab events functionality."""
 
-import json
-from typing import Optional
-from tabulate import tabulate
+from functools import lru_cache
+from typing import List, Optional
 
 from ..db_connection import Neo4jConnection
-from ..data_types import LabEvent, OutputFormat
-from ..constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE
+from ..formatting import format_by_patient, format_rows, render_grid
+from ..data_types import LabEvent, OutputFormat, cypher_projection, to_json
+from ..constants import OUTPUT_FORMAT_JSON
 
 
-async def list_lab_events(
-    db: Neo4jConnection,
-    patient_id: str,
-    admission_id: Optional[str] = None,
-    abnormal_only: bool = False,
-    category: Optional[str] = None,
-    limit: int = 20,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
-) -> str:
-    """List lab events for a patient."""
-    
-    # Build WHERE conditions
-    where_conditions = ["l.subject_id = $patient_id"]
+# Only the LabEvent fields, with datetimes rendered by Cypher
+_LAB_EVENT_PROJECTION = cypher_projection(LabEvent, "l", {
+    "charttime": "toString(l.charttime)",
+    "storetime": "toString(l.storetime)",
+})
+
+
+def _filter_conditions(has_admission: bool, abnormal_only: bool, has_category: bool) -> List[str]:
+    """WHERE conditions for the optional admission, abnormal and category filters."""
+    where_conditions = []
     
-    if admission_id:
+    if has_admission:
         where_conditions.append("l.hadm_id = $admission_id")
     
     if abnormal_only:
         where_conditions.append("l.flag IS NOT NULL AND l.flag <> 'normal'")
     
-    if category:
+    if has_category:
         where_conditions.append("toLower(l.category) = toLower($category)")
     
-    # Build query
-    query = f"""
+    return where_conditions
+
+
+@lru_cache(maxsize=None)
+def _build_patients_lab_query(abnormal_only: bool, has_category: bool) -> str:
+    """Build the query listing lab events for several patients in one round-trip.
+    
+    The per-patient subquery stops at $limit rows, so long lab histories are not
+    read in full.
+    """
+    where_conditions = [
+        "l.subject_id = pid",
+        *_filter_conditions(False, abnormal_only, has_category)
+    ]
+    
+    return f"""
+    UNWIND $patient_ids AS pid
+    CALL {{
+        WITH pid
+        MATCH (l:LabEvent)
+        WHERE {' AND '.join(where_conditions)}
+        WITH l
+        ORDER BY l.charttime DESC
+        LIMIT $limit
+        RETURN {_LAB_EVENT_PROJECTION} AS row
+    }}
+    RETURN pid, collect(row) AS rows
+    """
+
+
+@lru_cache(maxsize=None)
+def _build_lab_query(has_admission: bool, abnormal_only: bool, has_category: bool) -> str:
+    """Build the lab events query for one filter combination.
+    
+    Datetimes are returned as ISO 8601 strings by Cypher toString(), so rows
+    need no per-row conversion.
+    """
+    
+    # Build WHERE conditions
+    where_conditions = [
+        "l.subject_id = $patient_id",
+        *_filter_conditions(has_admission, abnormal_only, has_category)
+    ]
+    
+    return f"""
     MATCH (l:LabEvent)
     WHERE {' AND '.join(where_conditions)}
-    RETURN l
+    WITH l
     ORDER BY l.charttime DESC
     LIMIT $limit
+    RETURN {_LAB_EVENT_PROJECTION} AS l
     """
+
+
+async def list_lab_events(
+    db: Neo4jConnection,
+    patient_id: Optional[str] = None,
+    admission_id: Optional[str] = None,
+    abnormal_only: bool = False,
+    category: Optional[str] = None,
+    limit: int = 20,
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
+) -> str:
+    """List lab events for a patient.
+    
+    With ``patient_ids``, lab events for all those patients are fetched in one
+    query and grouped by patient, up to ``limit`` per patient; ``admission_id``
+    cannot be combined with it.
+    """
+    
+    if patient_ids:
+        if admission_id:
+            return to_json({"error": "admission_id cannot be combined with patient_ids"})
+        query = _build_patients_lab_query(abnormal_only, bool(category))
+        params = {"patient_ids": patient_ids, "category": category, "limit": limit}
+        results = await db.execute_read(query, params)
+        return format_by_patient(
+            patient_ids, results, LabEvent, "lab_events", format_lab_events_as_table, format
+        )
+    
+    if not patient_id:
+        return to_json({"error": "Either patient_id or patient_ids must be provided"})
+    
+    query = _build_lab_query(bool(admission_id), abnormal_only, bool(category))
     
     params = {
         "patient_id": patient_id,
@@ -48,30 +122,9 @@ async def list_lab_events(
         "limit": limit
     }
     
-    results = await db.execute_read(query, params)
-    
-    if not results:
-        return json.dumps({"lab_events": [], "message": "No lab events found"})
-    
-    # Process results - convert Neo4j DateTime objects to Python datetime
-    lab_events = []
-    for result in results:
-        r = result['l']
-        # Convert Neo4j DateTime to Python datetime for datetime fields
-        if 'charttime' in r and hasattr(r['charttime'], 'to_native'):
-            r['charttime'] = r['charttime'].to_native()
-        if 'storetime' in r and hasattr(r['storetime'], 'to_native'):
-            r['storetime'] = r['storetime'].to_native()
-        lab_events.append(LabEvent(**r))
-    
-    # Format output
-    if format == OUTPUT_FORMAT_TABLE:
-        return format_lab_events_as_table(lab_events)
-    else:
-        return json.dumps({
-            "lab_events": [l.model_dump(exclude_none=True) for l in lab_events],
-            "count": len(lab_events)
-        })
+    return await format_rows(
+        db.stream_read(query, params), "l", LabEvent, "lab_events", format_lab_events_as_table, format
+    )
 
 
 def format_lab_events_as_table(lab_events: list[LabEvent]) -> str:
@@ -97,4 +150,4 @@ def format_lab_events_as_table(lab_events: list[LabEvent]) -> str:
         ])
     
     headers = ["Test Name", "Value (Range)", "Flag", "Category", "Chart Time", "Admission ID"]
-    return tabulate(table_data, headers=headers, tablefmt="grid")
\ No newline at end of file
+    return render_grid(table_data, headers)
\ No newline at end of file
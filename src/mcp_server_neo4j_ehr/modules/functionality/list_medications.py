@@ -1,12 +1,75 @@
 """List medications functionality."""
 
-import json
-from typing import Optional
-from tabulate import tabulate
+from functools import lru_cache
+from typing import List, Optional
 
 from ..db_connection import Neo4jConnection
-from ..data_types import Medication, OutputFormat
-from ..constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE
+from ..formatting import format_by_patient, format_rows, render_grid
+from ..data_types import Medication, OutputFormat, cypher_projection, to_json
+from ..constants import OUTPUT_FORMAT_JSON
+
+
+# Only the Medication fields, with verifiedtime rendered by Cypher
+_MEDICATION_PROJECTION = cypher_projection(Medication, "m", {
+    "verifiedtime": "toString(m.verifiedtime)",
+})
+
+
+def _filter_conditions(has_medication: bool, has_route: bool) -> List[str]:
+    """WHERE conditions for the optional medication name and route filters."""
+    where_conditions = []
+    
+    if has_medication:
+        where_conditions.append("toLower(m.medication) CONTAINS toLower($medication)")
+    
+    if has_route:
+        where_conditions.append("toLower(m.route) = toLower($route)")
+    
+    return where_conditions
+
+
+@lru_cache(maxsize=None)
+def _build_patients_medication_query(has_medication: bool, has_route: bool) -> str:
+    """Build the query listing medications for several patients in one round-trip."""
+    where_conditions = ["m.subject_id = pid", *_filter_conditions(has_medication, has_route)]
+    
+    return f"""
+    UNWIND $patient_ids AS pid
+    CALL {{
+        WITH pid
+        MATCH (m:Medication)
+        WHERE {' AND '.join(where_conditions)}
+        WITH m
+        ORDER BY m.verifiedtime DESC
+        LIMIT $limit
+        RETURN {_MEDICATION_PROJECTION} AS row
+    }}
+    RETURN pid, collect(row) AS rows
+    """
+
+
+@lru_cache(maxsize=None)
+def _build_medication_query(by_admission: bool, has_medication: bool, has_route: bool) -> str:
+    """Build the medications query for one filter combination.
+    
+    verifiedtime is returned as an ISO 8601 string by Cypher toString(), so
+    rows need no per-row conversion.
+    """
+    
+    # Build query based on filters
+    where_conditions = [
+        "m.hadm_id = $admission_id" if by_admission else "m.subject_id = $patient_id",
+        *_filter_conditions(has_medication, has_route)
+    ]
+    
+    return f"""
+    MATCH (m:Medication)
+    WHERE {' AND '.join(where_conditions)}
+    WITH m
+    ORDER BY m.verifiedtime DESC
+    LIMIT $limit
+    RETURN {_MEDICATION_PROJECTION} AS m
+    """
 
 
 async def list_medications(
@@ -16,34 +79,30 @@ async def list_medications(
     medication: Optional[str] = None,
     route: Optional[str] = None,
     limit: int = 20,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
 ) -> str:
-    """List medications for a patient or admission."""
+    """List medications for a patient or admission.
     
-    # Build query based on filters
-    where_conditions = []
-    
-    if admission_id:
-        where_conditions.append("m.hadm_id = $admission_id")
-    elif patient_id:
-        where_conditions.append("m.subject_id = $patient_id")
-    else:
-        return json.dumps({"error": "Either patient_id or admission_id must be provided"})
+    With ``patient_ids``, medications for all those patients are fetched in one
+    query and grouped by patient, up to ``limit`` per patient; ``admission_id``
+    cannot be combined with it.
+    """
     
-    if medication:
-        where_conditions.append("toLower(m.medication) CONTAINS toLower($medication)")
+    if patient_ids:
+        if admission_id:
+            return to_json({"error": "admission_id cannot be combined with patient_ids"})
+        query = _build_patients_medication_query(bool(medication), bool(route))
+        params = {"patient_ids": patient_ids, "medication": medication, "route": route, "limit": limit}
+        results = await db.execute_read(query, params)
+        return format_by_patient(
+            patient_ids, results, Medication, "medications", format_medications_as_table, format
+        )
     
-    if route:
-        where_conditions.append("toLower(m.route) = toLower($route)")
+    if not admission_id and not patient_id:
+        return to_json({"error": "Either patient_id or admission_id must be provided"})
     
-    # Build query
-    query = f"""
-    MATCH (m:Medication)
-    WHERE {' AND '.join(where_conditions)}
-    RETURN m
-    ORDER BY m.verifiedtime DESC
-    LIMIT $limit
-    """
+    query = _build_medication_query(bool(admission_id), bool(medication), bool(route))
     
     params = {
         "patient_id": patient_id,
@@ -53,28 +112,9 @@ async def list_medications(
         "limit": limit
     }
     
-    results = await db.execute_read(query, params)
-    
-    if not results:
-        return json.dumps({"medications": [], "message": "No medications found"})
-    
-    # Process results - convert Neo4j DateTime objects to Python datetime
-    medications = []
-    for result in results:
-        r = result['m']
-        # Convert Neo4j DateTime to Python datetime for datetime fields
-        if 'verifiedtime' in r and hasattr(r['verifiedtime'], 'to_native'):
-            r['verifiedtime'] = r['verifiedtime'].to_native()
-        medications.append(Medication(**r))
-    
-    # Format output
-    if format == OUTPUT_FORMAT_TABLE:
-        return format_medications_as_table(medications)
-    else:
-        return json.dumps({
-            "medications": [m.model_dump(exclude_none=True) for m in medications],
-            "count": len(medications)
-        })
+    return await format_rows(
+        db.stream_read(query, params), "m", Medication, "medications", format_medications_as_table, format
+    )
 
 
 def format_medications_as_table(medications: list[Medication]) -> str:
@@ -93,4 +133,4 @@ def format_medications_as_table(medications: list[Medication]) -> str:
         ])
     
     headers = ["Medication", "Route", "Frequency", "Admission ID", "Verified Time"]
-    return tabulate(table_data, headers=headers, tablefmt="grid")
\ No newline at end of file
+    return render_grid(table_data, headers)
\ No newline at end of file
@@ -1,12 +1,46 @@
 """List procedures functionality."""
 
-import json
-from typing import Optional
-from tabulate import tabulate
+from typing import List, Optional
 
 from ..db_connection import Neo4jConnection
-from ..data_types import Procedure, OutputFormat
-from ..constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE
+from ..formatting import format_by_patient, format_rows, render_grid
+from ..data_types import Procedure, OutputFormat, cypher_projection, to_json
+from ..constants import OUTPUT_FORMAT_JSON
+
+
+# Only the Procedure fields are returned, not the whole node
+_PROJECTION = cypher_projection(Procedure, "p")
+
+# By patient, each row carries the ID of the admission it was found through
+_PATIENT_PROJECTION = cypher_projection(Procedure, "p", {"hadm_id": "a.hadm_id"})
+
+_ADMISSION_QUERY = f"""
+    MATCH (a:Admission {{hadm_id: $admission_id}})-[:HAS_PROCEDURE]->(p:Procedure)
+    RETURN {_PROJECTION} AS p
+    ORDER BY p.seq_num
+    LIMIT $limit
+"""
+
+_PATIENT_QUERY = f"""
+    MATCH (pat:Patient {{subject_id: $patient_id}})-[:HAS_ADMISSION]->(a:Admission)-[:HAS_PROCEDURE]->(p:Procedure)
+    RETURN {_PATIENT_PROJECTION} AS p
+    ORDER BY p.chartdate DESC, p.seq_num
+    LIMIT $limit
+"""
+
+# Several patients in one round-trip; the subquery stops at $limit rows per patient
+_PATIENTS_QUERY = f"""
+    UNWIND $patient_ids AS pid
+    CALL {{
+        WITH pid
+        MATCH (pat:Patient {{subject_id: pid}})-[:HAS_ADMISSION]->(a:Admission)-[:HAS_PROCEDURE]->(p:Procedure)
+        WITH a, p
+        ORDER BY p.chartdate DESC, p.seq_num
+        LIMIT $limit
+        RETURN {_PATIENT_PROJECTION} AS row
+    }}
+    RETURN pid, collect(row) AS rows
+"""
 
 
 async def list_procedures(
@@ -14,55 +48,37 @@ async def list_procedures(
     patient_id: Optional[str] = None,
     admission_id: Optional[str] = None,
     limit: int = 20,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
 ) -> str:
-    """List procedures for a patient or admission."""
+    """List procedures for a patient or admission.
+    
+    With ``patient_ids``, procedures for all those patients are fetched in one
+    query and grouped by patient, up to ``limit`` per patient; ``admission_id``
+    cannot be combined with it.
+    """
+    
+    if patient_ids:
+        if admission_id:
+            return to_json({"error": "admission_id cannot be combined with patient_ids"})
+        results = await db.execute_read(_PATIENTS_QUERY, {"patient_ids": patient_ids, "limit": limit})
+        return format_by_patient(
+            patient_ids, results, Procedure, "procedures", format_procedures_as_table, format
+        )
     
     # Build query based on filters
     if admission_id:
-        query = """
-        MATCH (a:Admission {hadm_id: $admission_id})-[:HAS_PROCEDURE]->(p:Procedure)
-        RETURN p
-        ORDER BY p.seq_num
-        LIMIT $limit
-        """
+        query = _ADMISSION_QUERY
         params = {"admission_id": admission_id, "limit": limit}
     elif patient_id:
-        query = """
-        MATCH (pat:Patient {subject_id: $patient_id})-[:HAS_ADMISSION]->(a:Admission)-[:HAS_PROCEDURE]->(p:Procedure)
-        RETURN p, a.hadm_id as hadm_id
-        ORDER BY p.chartdate DESC, p.seq_num
-        LIMIT $limit
-        """
+        query = _PATIENT_QUERY
         params = {"patient_id": patient_id, "limit": limit}
     else:
-        return json.dumps({"error": "Either patient_id or admission_id must be provided"})
+        return to_json({"error": "Either patient_id or admission_id must be provided"})
     
-    results = await db.execute_read(query, params)
-    
-    if not results:
-        return json.dumps({"procedures": [], "message": "No procedures found"})
-    
-    # Process results
-    procedures = []
-    for result in results:
-        procedure_data = result['p']
-        procedure = Procedure(**procedure_data)
-        
-        # Add admission ID if querying by patient
-        if patient_id and 'hadm_id' in result:
-            procedure.hadm_id = result['hadm_id']
-        
-        procedures.append(procedure)
-    
-    # Format output
-    if format == OUTPUT_FORMAT_TABLE:
-        return format_procedures_as_table(procedures)
-    else:
-        return json.dumps({
-            "procedures": [p.model_dump(exclude_none=True) for p in procedures],
-            "count": len(procedures)
-        })
+    return await format_rows(
+        db.stream_read(query, params), "p", Procedure, "procedures", format_procedures_as_table, format
+    )
 
 
 def format_procedures_as_table(procedures: list[Procedure]) -> str:
@@ -82,4 +98,4 @@ def format_procedures_as_table(procedures: list[Procedure]) -> str:
         ])
     
     headers = ["ICD Code", "Description", "Admission ID", "Chart Date", "Sequence", "Version"]
-    return tabulate(table_data, headers=headers, tablefmt="grid")
\ No newline at end of file
+    return render_grid(table_data, headers)
\ No newline at end of file
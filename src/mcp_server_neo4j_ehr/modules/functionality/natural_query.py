@@ -1,29 +1,77 @@
 """Natural language query functionality using LLM."""
 
-import json
+import hashlib
 import logging
-from typing import Any, Dict, List
-from openai import OpenAI
-from tabulate import tabulate
+import re
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+from neo4j.exceptions import ClientError
+from openai import AsyncOpenAI
 
 from ..db_connection import Neo4jConnection
-from ..data_types import OutputFormat
+from ..formatting import render_grid
+from ..data_types import OutputFormat, to_json
 from ..constants import (
     OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_MARKDOWN,
-    NATURAL_QUERY_SYSTEM_PROMPT
+    CYPHER_CACHE_MAX_ENTRIES, QUERY_RESULT_CACHE_TTL, EHR_RELATIONSHIPS,
+    NATURAL_QUERY_MODEL, NATURAL_QUERY_FALLBACK_MODEL, natural_query_system_prompt
 )
 
 logger = logging.getLogger(__name__)
 
+# Relationship lines of the LLM schema text, in arrow syntax with cardinality
+_RELATIONSHIP_LINES = tuple(
+    f"- ({from_label})-[:{rel_type}]->({to_label})  [{cardinality}]"
+    for from_label, rel_type, to_label, _, cardinality in EHR_RELATIONSHIPS
+)
+
+# Property groups of the LLM schema text (timestamps are recognized by name)
+_IDENTIFIER_PROPS = frozenset({"subject_id", "hadm_id", "note_id", "lab_event_id"})
+_CLINICAL_PROPS = frozenset({
+    "diagnosis", "medication", "icd_code", "long_title", "label", "value", "flag", "text"
+})
+
+# Matches a LIMIT clause at the very end of a query (optionally followed by ';')
+_TRAILING_LIMIT_RE = re.compile(r"\bLIMIT\s+(\d+)\s*;?\s*$", re.IGNORECASE)
+
+# A UNION splits a query into parts, and a trailing LIMIT then caps only the last
+_UNION_RE = re.compile(r"\bUNION\b", re.IGNORECASE)
+
+# Finds the first fenced code block in a response (``` or ~~~, optional
+# cypher/cql tag, closing fence optional) and captures its body
+_FENCE_RE = re.compile(
+    r"(```|~~~)[ \t]*(?:cypher|cql)?[ \t]*\n?(.*?)\s*(?:\1|\Z)",
+    re.DOTALL | re.IGNORECASE
+)
+
+# LLM rendering of the last schema seen, reused while the connection hands
+# back the same schema dict
+_schema_text_cache: Optional[Tuple[Dict[str, Any], str]] = None
+
+# Generated Cypher keyed by (normalized question, limit, schema fingerprint), and
+# query results keyed by (uri, database, Cypher, display limit) as (fetched at,
+# results). Both least recently used first.
+_ResultKey = Tuple[str, str, str, Optional[int]]
+_cypher_cache: "OrderedDict[Tuple[str, int, str], str]" = OrderedDict()
+_result_cache: "OrderedDict[_ResultKey, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+
 
 async def natural_query(
     db: Neo4jConnection,
     query: str,
     limit: int = 10,
     format: OutputFormat = OUTPUT_FORMAT_MARKDOWN,
-    openai_api_key: str = None
+    openai_api_key: str = None,
+    display_limit: Optional[int] = None
 ) -> str:
-    """Convert natural language query to Cypher and execute."""
+    """Convert natural language query to Cypher and execute.
+
+    When ``display_limit`` is set, at most that many rows are fetched from Neo4j:
+    in Cypher where the query allows it, otherwise by reading no further.
+    """
     
     try:
         # Log the incoming natural language query
@@ -31,51 +79,58 @@ async def natural_query(
         
         # First, get the database schema
         schema = await db.get_schema()
-        schema_text = format_schema_for_llm(schema)
+        schema_text = schema_text_for_llm(schema)
         logger.debug(f"Schema text sent to LLM: {schema_text[:500]}...")  # First 500 chars
         
-        # Generate Cypher query using LLM
-        client = OpenAI(api_key=openai_api_key)
-        
-        messages = [
-            {"role": "system", "content": NATURAL_QUERY_SYSTEM_PROMPT},
-            {"role": "user", "content": f"Database Schema:\n{schema_text}\n\nQuestion: {query}\n\nGenerate a Cypher query with LIMIT {limit}:"}
-        ]
-        
-        logger.info("Sending query to OpenAI GPT-4...")
-        response = client.chat.completions.create(
-            model="gpt-4.1-nano",
-            messages=messages,
-            temperature=0.1,
-            max_tokens=500
+        cypher_key = (
+            _normalize_question(query),
+            limit,
+            hashlib.blake2b(schema_text.encode(), digest_size=8).hexdigest()
         )
+        cached_cypher = _cypher_cache.get(cypher_key)
+        client = None
+        if cached_cypher is not None:
+            _cypher_cache.move_to_end(cypher_key)
+            generated_query = cached_cypher
+            logger.info(f"Reusing cached Cypher query: {generated_query}")
+        else:
+            client = _openai_client(openai_api_key)
+            generated_query = await _generate_cypher(client, NATURAL_QUERY_MODEL, schema_text, query, limit)
         
-        cypher_query = response.choices[0].message.content.strip()
-        logger.info(f"Raw LLM response: {cypher_query}")
-        
-        # Clean up the query (remove markdown code blocks if present)
-        if cypher_query.startswith("```"):
-            cypher_query = cypher_query.split("```")[1]
-            if cypher_query.startswith("cypher"):
-                cypher_query = cypher_query[6:]
-        cypher_query = cypher_query.strip()
-        
-        logger.info(f"Cleaned Cypher query: {cypher_query}")
-        
-        # Execute the query
+        # Execute the query. Freshly generated Cypher that Neo4j rejects is regenerated
+        # once by the fallback model, which is shown the error. Driver, transient and
+        # timeout errors are not the query's fault and are reported as they are.
+        cypher_query = generated_query
         try:
-            results = await db.execute_read(cypher_query)
+            try:
+                cypher_query, results = await _execute_cypher(db, generated_query, display_limit)
+            except ClientError as e:
+                if client is None:
+                    raise
+                logger.warning(f"Generated Cypher failed ({e}); retrying with {NATURAL_QUERY_FALLBACK_MODEL}")
+                generated_query = await _generate_cypher(
+                    client, NATURAL_QUERY_FALLBACK_MODEL, schema_text, query, limit,
+                    failure=(generated_query, str(e))
+                )
+                cypher_query = generated_query
+                cypher_query, results = await _execute_cypher(db, generated_query, display_limit)
             logger.info(f"Query executed successfully. Result count: {len(results)}")
             if results and len(results) > 0:
                 logger.debug(f"First result: {results[0]}")
         except Exception as e:
             logger.error(f"Error executing Cypher query: {e}")
-            return json.dumps({
+            return to_json({
                 "error": "Failed to execute generated query",
                 "query": cypher_query,
                 "details": str(e)
             })
         
+        # Only remember Cypher that ran, so a failing query is regenerated next time
+        if cached_cypher is None:
+            _cypher_cache[cypher_key] = generated_query
+            if len(_cypher_cache) > CYPHER_CACHE_MAX_ENTRIES:
+                _cypher_cache.popitem(last=False)
+        
         # Format results
         response_data = {
             "question": query,
@@ -90,16 +145,179 @@ async def natural_query(
         elif format == OUTPUT_FORMAT_TABLE:
             return format_natural_query_as_table(response_data)
         else:
-            return json.dumps(response_data)
+            return to_json(response_data)
             
     except Exception as e:
         logger.error(f"Error in natural language query: {e}")
-        return json.dumps({
+        return to_json({
             "error": "Failed to process natural language query",
             "details": str(e)
         })
 
 
+async def _generate_cypher(
+    client: AsyncOpenAI,
+    model: str,
+    schema_text: str,
+    query: str,
+    limit: int,
+    failure: Optional[Tuple[str, str]] = None
+) -> str:
+    """Ask the model for a Cypher query answering the question.
+    
+    ``failure`` is a previously generated query and the error it raised, which
+    the model is asked to correct.
+    """
+    # Keep the system message byte-identical across calls (instructions +
+    # schema) so OpenAI's automatic prompt caching can reuse the prefix;
+    # only the question and limit (and any failure) vary, and they go last.
+    prompt = f"Question: {query}\n\nGenerate a Cypher query with LIMIT {limit}:"
+    if failure is not None:
+        failed_query, error = failure
+        prompt += (
+            f"\n\nA previous attempt failed.\nQuery: {failed_query}\nError: {error}\n"
+            "Fix the query and return only the corrected Cypher."
+        )
+    messages = [
+        {"role": "system", "content": build_system_prompt(schema_text)},
+        {"role": "user", "content": prompt}
+    ]
+    
+    logger.info(f"Sending query to OpenAI ({model})...")
+    response = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        temperature=0.1,
+        max_tokens=500
+    )
+    
+    usage = response.usage
+    if usage and usage.prompt_tokens_details:
+        logger.info(
+            f"Prompt tokens: {usage.prompt_tokens} "
+            f"(cached: {usage.prompt_tokens_details.cached_tokens})"
+        )
+    
+    cypher_query = response.choices[0].message.content.strip()
+    logger.info(f"Raw LLM response: {cypher_query}")
+    
+    # Clean up the query (remove markdown code blocks if present)
+    cypher_query = strip_code_fence(cypher_query)
+    
+    logger.info(f"Cleaned Cypher query: {cypher_query}")
+    return cypher_query
+
+
+async def _execute_cypher(
+    db: Neo4jConnection,
+    generated_query: str,
+    display_limit: Optional[int]
+) -> Tuple[str, List[Dict[str, Any]]]:
+    """Run a generated query, capped at display_limit rows if given.
+    
+    A query whose LIMIT cannot be rewritten runs as generated, and reading stops
+    after display_limit records. Results fetched for the same Cypher moments ago
+    are reused. Returns the query that ran and its results.
+    """
+    cypher_query = generated_query
+    capped_query = None
+    if display_limit is not None:
+        capped_query = apply_display_limit(generated_query, display_limit)
+        if capped_query is not None:
+            cypher_query = capped_query
+            logger.info(f"Display-limited Cypher query: {cypher_query}")
+    
+    cache_key = (db.uri, db.database, cypher_query, display_limit)
+    results = _cached_results(cache_key)
+    if results is None:
+        if display_limit is None or capped_query is not None:
+            results = await db.execute_read(cypher_query)
+        else:
+            results = []
+            async with aclosing(db.stream_read(cypher_query)) as records:
+                async for record in records:
+                    if len(results) == display_limit:
+                        break
+                    results.append(record)
+        _cache_results(cache_key, results)
+    return cypher_query, results
+
+
+@lru_cache(maxsize=4)
+def _openai_client(api_key: str) -> AsyncOpenAI:
+    """Return the OpenAI client for this API key, created once and reused."""
+    return AsyncOpenAI(api_key=api_key)
+
+
+def _normalize_question(query: str) -> str:
+    """Cache key form of a question: case, spacing and closing punctuation ignored."""
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+
+def build_system_prompt(schema_text: str) -> str:
+    """Build the static system prompt: instructions followed by the schema."""
+    return f"{natural_query_system_prompt()}\nDatabase Schema:\n{schema_text}"
+
+
+def _cached_results(key: _ResultKey) -> Optional[List[Dict[str, Any]]]:
+    """Return results fetched for this (uri, database, Cypher, display limit) within the result TTL, if any."""
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[0] >= QUERY_RESULT_CACHE_TTL:
+        del _result_cache[key]
+        return None
+    _result_cache.move_to_end(key)
+    return entry[1]
+
+
+def _cache_results(key: _ResultKey, results: List[Dict[str, Any]]) -> None:
+    """Remember results for this (uri, database, Cypher, display limit), evicting the least recently used entry."""
+    _result_cache[key] = (time.monotonic(), results)
+    _result_cache.move_to_end(key)
+    if len(_result_cache) > CYPHER_CACHE_MAX_ENTRIES:
+        _result_cache.popitem(last=False)
+
+
+def clear_query_caches() -> None:
+    """Forget all cached Cypher and query results."""
+    _cypher_cache.clear()
+    _result_cache.clear()
+
+
+def strip_code_fence(response: str) -> str:
+    """Return the body of the first fenced code block in response, or response itself.
+    
+    Text around the block (an introduction, or further blocks) is dropped.
+    """
+    fenced = _FENCE_RE.search(response)
+    return (fenced.group(2) if fenced else response).strip()
+
+
+def apply_display_limit(cypher_query: str, display_limit: int) -> Optional[str]:
+    """Cap a Cypher query at display_limit rows, or return None if it can't be.
+
+    Only a trailing LIMIT on a query without UNION is rewritten, to the smaller
+    of the two values. Wrapping other queries in a subquery is not safe: it
+    fails on unaliased return items and reorders the columns.
+    """
+    match = _TRAILING_LIMIT_RE.search(cypher_query)
+    if not match or _UNION_RE.search(cypher_query):
+        return None
+    limit = min(int(match.group(1)), display_limit)
+    return f"{cypher_query[:match.start()]}LIMIT {limit}"
+
+
+def schema_text_for_llm(schema: Dict[str, Any]) -> str:
+    """Format the schema for the LLM, reusing the result while the schema is unchanged."""
+    global _schema_text_cache
+    if _schema_text_cache is not None and _schema_text_cache[0] is schema:
+        return _schema_text_cache[1]
+    text = format_schema_for_llm(schema)
+    _schema_text_cache = (schema, text)
+    return text
+
+
 def format_schema_for_llm(schema: Dict[str, Any]) -> str:
     """Format schema information for LLM context."""
     lines = []
@@ -127,11 +345,11 @@ def format_schema_for_llm(schema: Dict[str, Any]) -> str:
             prop_info = f"  - {prop}: {property_types.get(prop, 'string')}"
             
             # Categorize properties
-            if prop in ["subject_id", "hadm_id", "note_id", "lab_event_id"]:
+            if prop in _IDENTIFIER_PROPS:
                 identifiers.append(prop_info)
             elif "time" in prop or "date" in prop or prop == "dod":
                 timestamps.append(prop_info)
-            elif prop in ["diagnosis", "medication", "icd_code", "long_title", "label", "value", "flag", "text"]:
+            elif prop in _CLINICAL_PROPS:
                 clinical_data.append(prop_info)
             else:
                 other.append(prop_info)
@@ -153,13 +371,7 @@ def format_schema_for_llm(schema: Dict[str, Any]) -> str:
     
     # Relationships with cardinality
     lines.append("RELATIONSHIPS:")
-    lines.append("- (Patient)-[:HAS_ADMISSION]->(Admission)  [1 patient : many admissions]")
-    lines.append("- (Admission)-[:INCLUDES_DISCHARGE_NOTE]->(DischargeNote)  [1 admission : many notes]")
-    lines.append("- (Admission)-[:INCLUDES_RADIOLOGY_REPORT]->(RadiologyReport)  [1 admission : many reports]")
-    lines.append("- (Admission)-[:HAS_DIAGNOSIS]->(Diagnosis)  [1 admission : many diagnoses]")
-    lines.append("- (Admission)-[:HAS_PROCEDURE]->(Procedure)  [1 admission : many procedures]")
-    lines.append("- (Admission)-[:HAS_MEDICATION]->(Medication)  [1 admission : many medications]")
-    lines.append("- (Admission)-[:INCLUDES_LAB_EVENT]->(LabEvent)  [1 admission : many lab events]")
+    lines.extend(_RELATIONSHIP_LINES)
     lines.append("")
     
     # Query guidelines
@@ -183,47 +395,37 @@ def format_schema_for_llm(schema: Dict[str, Any]) -> str:
 
 def format_natural_query_as_markdown(data: Dict[str, Any]) -> str:
     """Format natural query results as markdown."""
-    lines = []
-    
-    lines.append(f"## Question\n{data['question']}\n")
-    lines.append(f"## Generated Cypher Query\n```cypher\n{data['cypher_query']}\n```\n")
-    lines.append(f"## Results ({data['count']} rows)\n")
+    results = data['results']
+    header = (
+        f"## Question\n{data['question']}\n\n"
+        f"## Generated Cypher Query\n```cypher\n{data['cypher_query']}\n```\n\n"
+        f"## Results ({data['count']} rows)\n\n"
+    )
+    if not results:
+        return header + "No results found."
     
-    if data['results']:
-        # Create table from results
-        first_row = data['results'][0]
-        headers = list(first_row.keys())
-        
-        lines.append("| " + " | ".join(headers) + " |")
-        lines.append("| " + " | ".join(["-" * len(h) for h in headers]) + " |")
-        
-        for row in data['results']:
-            values = [str(row.get(h, "")) for h in headers]
-            lines.append("| " + " | ".join(values) + " |")
-    else:
-        lines.append("No results found.")
-    
-    return "\n".join(lines)
+    # Create table from results
+    headers = list(results[0].keys())
+    return "".join([
+        header,
+        "| " + " | ".join(headers) + " |\n",
+        "| " + " | ".join(["-" * len(h) for h in headers]) + " |",
+        *["\n| " + " | ".join([str(row.get(h, "")) for h in headers]) + " |" for row in results],
+    ])
 
 
 def format_natural_query_as_table(data: Dict[str, Any]) -> str:
     """Format natural query results as table."""
-    output = []
-    
-    output.append(f"QUESTION: {data['question']}")
-    output.append(f"\nCYPHER QUERY:\n{data['cypher_query']}")
-    output.append(f"\nRESULTS ({data['count']} rows):")
-    
-    if data['results']:
-        # Convert results to table
-        headers = list(data['results'][0].keys())
-        table_data = []
-        
-        for row in data['results']:
-            table_data.append([str(row.get(h, "")) for h in headers])
-        
-        output.append(tabulate(table_data, headers=headers, tablefmt="grid"))
-    else:
-        output.append("No results found.")
+    results = data['results']
+    header = (
+        f"QUESTION: {data['question']}\n"
+        f"\nCYPHER QUERY:\n{data['cypher_query']}\n"
+        f"\nRESULTS ({data['count']} rows):\n"
+    )
+    if not results:
+        return header + "No results found."
     
-    return "\n".join(output)
\ No newline at end of file
+    # Convert results to table
+    headers = list(results[0].keys())
+    rows = [[str(row.get(h, "")) for h in headers] for row in results]
+    return header + render_grid(rows, headers)
@@ -1,14 +1,58 @@
 """Patient query functionality."""
 
-import json
-from typing import Optional
-from tabulate import tabulate
+from typing import Any, Dict, Optional, Tuple
+
+import neo4j.time
 
 from ..db_connection import Neo4jConnection
-from ..data_types import Patient, Admission, Diagnosis, Procedure, Medication, LabEvent, PatientResponse, OutputFormat
+from ..formatting import render_grid
+from ..data_types import Patient, Admission, Diagnosis, Procedure, Medication, LabEvent, PatientResponse, OutputFormat, to_json
 from ..constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE
 
 
+# Temporal properties of each node type, converted to Python values before validation
+_PATIENT_TEMPORAL = ('dod',)
+_ADMISSION_TEMPORAL = ('admittime', 'dischtime', 'deathtime', 'edregtime', 'edouttime')
+_PROCEDURE_TEMPORAL = ('chartdate',)
+_MEDICATION_TEMPORAL = ('verifiedtime',)
+_LAB_EVENT_TEMPORAL = ('charttime', 'storetime')
+
+# Subquery collecting each kind of related node for the patient `p`
+_RELATED_SUBQUERIES = {
+    "admissions": (
+        "OPTIONAL MATCH (p)-[:HAS_ADMISSION]->(a:Admission)\n"
+        "    RETURN COLLECT(a) as admissions"
+    ),
+    "diagnoses": (
+        "OPTIONAL MATCH (p)-[:HAS_ADMISSION]->(:Admission)-[:HAS_DIAGNOSIS]->(d:Diagnosis)\n"
+        "    RETURN COLLECT(DISTINCT d) as diagnoses"
+    ),
+    "procedures": (
+        "OPTIONAL MATCH (p)-[:HAS_ADMISSION]->(:Admission)-[:HAS_PROCEDURE]->(proc:Procedure)\n"
+        "    RETURN COLLECT(DISTINCT proc) as procedures"
+    ),
+    "medications": (
+        "OPTIONAL MATCH (p)-[:HAS_ADMISSION]->(:Admission)-[:HAS_MEDICATION]->(m:Medication)\n"
+        "    RETURN COLLECT(DISTINCT m) as medications"
+    ),
+    "lab_events": (
+        "OPTIONAL MATCH (p)-[:HAS_ADMISSION]->(:Admission)-[:INCLUDES_LAB_EVENT]->(l:LabEvent)\n"
+        "    RETURN COLLECT(DISTINCT l) as lab_events"
+    ),
+}
+
+_NEO4J_TEMPORAL_TYPES = (neo4j.time.DateTime, neo4j.time.Date, neo4j.time.Time)
+
+
+def _to_native(node: Dict[str, Any], keys: Tuple[str, ...]) -> Dict[str, Any]:
+    """Convert Neo4j temporal values under the given keys to Python values, in place."""
+    for key in keys:
+        value = node.get(key)
+        if isinstance(value, _NEO4J_TEMPORAL_TYPES):
+            node[key] = value.to_native()
+    return node
+
+
 async def get_patient(
     db: Neo4jConnection,
     subject_id: str,
@@ -21,36 +65,21 @@ async def get_patient(
 ) -> str:
     """Get comprehensive patient information."""
     
-    # Build the main query
+    # Build the main query: each related collection comes from its own subquery, so
+    # the collections are never multiplied together into one row stream
+    included = {
+        "admissions": include_admissions,
+        "diagnoses": include_diagnoses,
+        "procedures": include_procedures,
+        "medications": include_medications,
+        "lab_events": include_lab_events,
+    }
     query_parts = ["MATCH (p:Patient {subject_id: $subject_id})"]
-    
-    if include_admissions:
-        query_parts.append("OPTIONAL MATCH (p)-[:HAS_ADMISSION]->(a:Admission)")
-    
-    if include_diagnoses:
-        query_parts.append("OPTIONAL MATCH (a)-[:HAS_DIAGNOSIS]->(d:Diagnosis)")
-    
-    if include_procedures:
-        query_parts.append("OPTIONAL MATCH (a)-[:HAS_PROCEDURE]->(proc:Procedure)")
-    
-    if include_medications:
-        query_parts.append("OPTIONAL MATCH (a)-[:HAS_MEDICATION]->(m:Medication)")
-    
-    if include_lab_events:
-        query_parts.append("OPTIONAL MATCH (a)-[:INCLUDES_LAB_EVENT]->(l:LabEvent)")
-    
-    # Build return statement
     return_parts = ["p"]
-    if include_admissions:
-        return_parts.append("COLLECT(DISTINCT a) as admissions")
-    if include_diagnoses:
-        return_parts.append("COLLECT(DISTINCT d) as diagnoses")
-    if include_procedures:
-        return_parts.append("COLLECT(DISTINCT proc) as procedures")
-    if include_medications:
-        return_parts.append("COLLECT(DISTINCT m) as medications")
-    if include_lab_events:
-        return_parts.append("COLLECT(DISTINCT l) as lab_events")
+    for name, include in included.items():
+        if include:
+            query_parts.append(f"CALL {{\n    WITH p\n    {_RELATED_SUBQUERIES[name]}\n}}")
+            return_parts.append(name)
     
     query = "\n".join(query_parts) + f"\nRETURN {', '.join(return_parts)}"
     
@@ -58,77 +87,43 @@ async def get_patient(
     results = await db.execute_read(query, {"subject_id": subject_id})
     
     if not results:
-        return json.dumps({"error": f"Patient {subject_id} not found"})
+        return to_json({"error": f"Patient {subject_id} not found"})
     
     result = results[0]
     
     # Build response
-    patient_data = result['p']
-    # Convert Neo4j DateTime to Python datetime for patient datetime fields
-    if 'dod' in patient_data and hasattr(patient_data['dod'], 'to_native'):
-        patient_data['dod'] = patient_data['dod'].to_native()
-    patient = Patient(**patient_data)
+    patient = Patient.model_validate(_to_native(result['p'], _PATIENT_TEMPORAL))
     
     response = PatientResponse(patient=patient)
     
     if include_admissions and 'admissions' in result:
-        admissions = []
-        for a in result['admissions']:
-            if a:
-                # Convert Neo4j DateTime to Python datetime for datetime fields
-                if 'admittime' in a and hasattr(a['admittime'], 'to_native'):
-                    a['admittime'] = a['admittime'].to_native()
-                if 'dischtime' in a and hasattr(a['dischtime'], 'to_native'):
-                    a['dischtime'] = a['dischtime'].to_native()
-                if 'deathtime' in a and hasattr(a['deathtime'], 'to_native'):
-                    a['deathtime'] = a['deathtime'].to_native()
-                if 'edregtime' in a and hasattr(a['edregtime'], 'to_native'):
-                    a['edregtime'] = a['edregtime'].to_native()
-                if 'edouttime' in a and hasattr(a['edouttime'], 'to_native'):
-                    a['edouttime'] = a['edouttime'].to_native()
-                admissions.append(Admission(**a))
-        response.admissions = admissions
+        response.admissions = [
+            Admission.model_validate(_to_native(a, _ADMISSION_TEMPORAL)) for a in result['admissions'] if a
+        ]
     
     if include_diagnoses and 'diagnoses' in result and result['diagnoses'] is not None:
-        response.diagnoses = [Diagnosis(**d) for d in result['diagnoses'] if d]
+        response.diagnoses = [Diagnosis.model_validate(d) for d in result['diagnoses'] if d]
     
     if include_procedures and 'procedures' in result and result['procedures'] is not None:
-        procedures = []
-        for p in result['procedures']:
-            if p:
-                # Convert Neo4j DateTime to Python datetime for datetime fields
-                if 'chartdate' in p and hasattr(p['chartdate'], 'to_native'):
-                    p['chartdate'] = p['chartdate'].to_native()
-                procedures.append(Procedure(**p))
-        response.procedures = procedures
+        response.procedures = [
+            Procedure.model_validate(_to_native(p, _PROCEDURE_TEMPORAL)) for p in result['procedures'] if p
+        ]
     
     if include_medications and 'medications' in result and result['medications'] is not None:
-        medications = []
-        for m in result['medications']:
-            if m:
-                # Convert Neo4j DateTime to Python datetime for datetime fields
-                if 'verifiedtime' in m and hasattr(m['verifiedtime'], 'to_native'):
-                    m['verifiedtime'] = m['verifiedtime'].to_native()
-                medications.append(Medication(**m))
-        response.medications = medications
+        response.medications = [
+            Medication.model_validate(_to_native(m, _MEDICATION_TEMPORAL)) for m in result['medications'] if m
+        ]
     
     if include_lab_events and 'lab_events' in result and result['lab_events'] is not None:
-        lab_events = []
-        for l in result['lab_events']:
-            if l:
-                # Convert Neo4j DateTime to Python datetime for datetime fields
-                if 'charttime' in l and hasattr(l['charttime'], 'to_native'):
-                    l['charttime'] = l['charttime'].to_native()
-                if 'storetime' in l and hasattr(l['storetime'], 'to_native'):
-                    l['storetime'] = l['storetime'].to_native()
-                lab_events.append(LabEvent(**l))
-        response.lab_events = lab_events
+        response.lab_events = [
+            LabEvent.model_validate(_to_native(l, _LAB_EVENT_TEMPORAL)) for l in result['lab_events'] if l
+        ]
     
     # Format output
     if format == OUTPUT_FORMAT_TABLE:
         return format_patient_as_table(response)
     else:
-        return response.model_dump_json(exclude_none=True)
+        return to_json(response.model_dump(exclude_none=True))
 
 
 def format_patient_as_table(response: PatientResponse) -> str:
@@ -143,7 +138,7 @@ def format_patient_as_table(response: PatientResponse) -> str:
         ["Date of Death", response.patient.dod or "N/A"]
     ]
     output.append("PATIENT INFORMATION")
-    output.append(tabulate(patient_info, headers=["Field", "Value"], tablefmt="grid"))
+    output.append(render_grid(patient_info, ["Field", "Value"]))
     
     # Admissions
     if response.admissions:
@@ -156,9 +151,8 @@ def format_patient_as_table(response: PatientResponse) -> str:
                 str(adm.admittime) if adm.admittime else "N/A",
                 str(adm.dischtime) if adm.dischtime else "N/A"
             ])
-        output.append(tabulate(admission_data, 
-                             headers=["Admission ID", "Type", "Admit Time", "Discharge Time"],
-                             tablefmt="grid"))
+        output.append(render_grid(admission_data,
+                                 ["Admission ID", "Type", "Admit Time", "Discharge Time"]))
     
     # Similar formatting for other sections...
     
@@ -1,7 +1,9 @@
 """Main server implementation for Neo4j EHR MCP Server."""
 
+import asyncio
 import logging
-from typing import Literal, Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Literal, Optional
 from fastmcp import FastMCP
 from neo4j import AsyncDriver
 
@@ -14,20 +16,44 @@ from .modules.functionality.list_diagnoses import list_diagnoses
 from .modules.functionality.list_lab_events import list_lab_events
 from .modules.functionality.list_medications import list_medications
 from .modules.functionality.list_procedures import list_procedures
-from .modules.functionality.natural_query import natural_query
-from .modules.functionality.get_schema import get_schema
+from .modules.functionality.natural_query import natural_query, schema_text_for_llm
+from .modules.functionality.get_schema import get_schema, prewarm_schema_cache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create MCP server instance
-mcp = FastMCP("mcp-server-neo4j-ehr")
-
 # Global variables for database connection and OpenAI key
 db_connection: Optional[Neo4jConnection] = None
 openai_api_key: Optional[str] = None
 
 
+async def _warm_up(db: Neo4jConnection) -> None:
+    """Render the schema caches and open a first pooled connection to Neo4j."""
+    await prewarm_schema_cache(db)
+    schema_text_for_llm(await db.get_schema())
+    try:
+        reachable = await asyncio.wait_for(db.test_connection(), STARTUP_CONNECTION_CHECK_TIMEOUT)
+    except asyncio.TimeoutError:
+        reachable = False
+    if not reachable:
+        logger.warning("Neo4j is not reachable at startup")
+
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Warm the caches in the background, so startup never waits on Neo4j."""
+    warm_up = asyncio.create_task(_warm_up(db_connection)) if db_connection else None
+    try:
+        yield
+    finally:
+        if warm_up:
+            warm_up.cancel()
+
+
+# Create MCP server instance
+mcp = FastMCP("mcp-server-neo4j-ehr", lifespan=lifespan)
+
+
 @mcp.tool
 async def ehr_patient(
     subject_id: str,
@@ -75,29 +101,33 @@ async def ehr_list_diagnoses(
     patient_id: Optional[str] = None,
     admission_id: Optional[str] = None,
     limit: int = DEFAULT_LIMIT,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
 ) -> str:
-    """List diagnoses for a patient or admission."""
+    """List diagnoses for a patient or admission, or for several patients at once."""
     if not db_connection:
         return '{"error": "Database connection not initialized"}'
-    return await list_diagnoses(db_connection, patient_id, admission_id, limit, format)
+    return await list_diagnoses(
+        db_connection, patient_id, admission_id, limit, format, patient_ids=patient_ids
+    )
 
 
 @mcp.tool
 async def ehr_list_lab_events(
-    patient_id: str,
+    patient_id: Optional[str] = None,
     admission_id: Optional[str] = None,
     abnormal_only: bool = False,
     category: Optional[str] = None,
     limit: int = DEFAULT_LIMIT,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
 ) -> str:
-    """List lab events for a patient."""
+    """List lab events for a patient, or for several patients at once."""
     if not db_connection:
         return '{"error": "Database connection not initialized"}'
     return await list_lab_events(
         db_connection, patient_id, admission_id, abnormal_only,
-        category, limit, format
+        category, limit, format, patient_ids=patient_ids
     )
 
 
@@ -108,14 +138,15 @@ async def ehr_list_medications(
     medication: Optional[str] = None,
     route: Optional[str] = None,
     limit: int = DEFAULT_LIMIT,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
 ) -> str:
-    """List medications for a patient or admission."""
+    """List medications for a patient or admission, or for several patients at once."""
     if not db_connection:
         return '{"error": "Database connection not initialized"}'
     return await list_medications(
         db_connection, patient_id, admission_id, medication,
-        route, limit, format
+        route, limit, format, patient_ids=patient_ids
     )
 
 
@@ -124,12 +155,15 @@ async def ehr_list_procedures(
     patient_id: Optional[str] = None,
     admission_id: Optional[str] = None,
     limit: int = DEFAULT_LIMIT,
-    format: OutputFormat = OUTPUT_FORMAT_JSON
+    format: OutputFormat = OUTPUT_FORMAT_JSON,
+    patient_ids: Optional[List[str]] = None
 ) -> str:
-    """List procedures for a patient or admission."""
+    """List procedures for a patient or admission, or for several patients at once."""
     if not db_connection:
         return '{"error": "Database connection not initialized"}'
-    return await list_procedures(db_connection, patient_id, admission_id, limit, format)
+    return await list_procedures(
+        db_connection, patient_id, admission_id, limit, format, patient_ids=patient_ids
+    )
 
 
 @mcp.tool
@@ -177,7 +211,7 @@ def main(
     driver = create_neo4j_driver(neo4j_uri, neo4j_username, neo4j_password)
     
     # Initialize global variables
-    db_connection = Neo4jConnection(driver, neo4j_database)
+    db_connection = Neo4jConnection(driver, neo4j_database, neo4j_uri)
     openai_api_key = openai_api_key_param
     
     # Run the server with correct parameters
@@ -28,6 +28,15 @@ def event_loop():
 def mock_db_connection():
     """Create a mock database connection for unit tests."""
     mock_connection = AsyncMock(spec=Neo4jConnection)
+    mock_connection.uri = "bolt://localhost:7687"
+    mock_connection.database = "neo4j"
+    
+    # Stream whatever execute_read is mocked to return, so tests configure one mock
+    async def stream_read(query, parameters=None, timeout=None):
+        for record in await mock_connection.execute_read(query, parameters):
+            yield record
+    
+    mock_connection.stream_read = MagicMock(side_effect=stream_read)
     return mock_connection
 
 
@@ -44,7 +53,7 @@ async def real_db_connection():
         pytest.skip("Neo4j credentials not configured for integration tests")
     
     driver = create_neo4j_driver(uri, username, password)
-    connection = Neo4jConnection(driver, database)
+    connection = Neo4jConnection(driver, database, uri)
     
     # Test the connection
     if not await connection.test_connection():
@@ -167,7 +176,7 @@ def mock_openai_response():
     ))
     mock.chat = MagicMock()
     mock.chat.completions = MagicMock()
-    mock.chat.completions.create = MagicMock(return_value=MagicMock(
+    mock.chat.completions.create = AsyncMock(return_value=MagicMock(
         choices=[MagicMock(message=MagicMock(content='{"tool": "test_tool", "arguments": {}}'))]
     ))
     return mock
\ No newline at end of file
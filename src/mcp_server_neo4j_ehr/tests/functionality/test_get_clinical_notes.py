@@ -1,10 +1,12 @@
 """Tests for get clinical notes functionality."""
 
 import json
+from datetime import datetime, timedelta, timezone
+
 import pytest
 from unittest.mock import AsyncMock, MagicMock
 
-from ...modules.functionality.get_clinical_notes import get_clinical_notes
+from ...modules.functionality.get_clinical_notes import get_clinical_notes, stream_clinical_notes
 from ...modules.constants import (
     OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_TEXT,
     NOTE_TYPE_DISCHARGE, NOTE_TYPE_RADIOLOGY, NOTE_TYPE_ALL
@@ -17,15 +19,16 @@ class TestGetClinicalNotesFunctionality:
     @pytest.mark.asyncio
     async def test_get_all_notes(self, mock_db_connection, sample_discharge_note):
         """Test getting all notes without filters."""
-        # Mock database response
-        mock_db_connection.execute_read.return_value = [{
+        # Mock database response: one discharge note, no radiology reports
+        mock_db_connection.execute_read.side_effect = [[{
             'note_id': sample_discharge_note.note_id,
             'note_type': sample_discharge_note.note_type,
             'subject_id': sample_discharge_note.subject_id,
             'hadm_id': sample_discharge_note.hadm_id,
-            'charttime': sample_discharge_note.charttime,
+            'charttime': sample_discharge_note.charttime.isoformat(),
+            '_sort': sample_discharge_note.charttime,
             'text': sample_discharge_note.text
-        }]
+        }], []]
         
         # Call function
         result = await get_clinical_notes(
@@ -44,6 +47,73 @@ class TestGetClinicalNotesFunctionality:
         assert data[0]['note_id'] == sample_discharge_note.note_id
         assert data[0]['text'] == sample_discharge_note.text
     
+    @pytest.mark.asyncio
+    async def test_get_all_notes_merges_labels_by_charttime(self, mock_db_connection):
+        """Test that both note labels are queried and merged newest first."""
+        def note(note_id, note_type, charttime):
+            return {'note_id': note_id, 'note_type': note_type, 'charttime': charttime, 'text': 'x',
+                    '_sort': datetime.fromisoformat(charttime)}
+        
+        mock_db_connection.execute_read.side_effect = [
+            [note('d2', 'DS', '2124-08-10T00:00:00'), note('d1', 'DS', '2124-08-01T00:00:00')],
+            [note('r2', 'RR', '2124-08-05T00:00:00'), note('r1', 'RR', '2124-07-01T00:00:00')]
+        ]
+        
+        result = await get_clinical_notes(
+            mock_db_connection,
+            note_type=NOTE_TYPE_ALL,
+            limit=3,
+            format=OUTPUT_FORMAT_JSON
+        )
+        
+        assert [n['note_id'] for n in json.loads(result)] == ['d2', 'r2', 'd1']
+        queries = [c[0][0] for c in mock_db_connection.execute_read.call_args_list]
+        assert "MATCH (note:DischargeNote)" in queries[0]
+        assert "MATCH (note:RadiologyReport)" in queries[1]
+    
+    @pytest.mark.asyncio
+    async def test_get_all_notes_merges_null_charttime_first(self, mock_db_connection):
+        """Test that the merge keeps Neo4j's DESC order, where null charttimes come first."""
+        def note(note_id, charttime):
+            return {'note_id': note_id, 'note_type': 'DS', 'charttime': charttime, 'text': 'x',
+                    '_sort': charttime and datetime.fromisoformat(charttime)}
+        
+        mock_db_connection.execute_read.side_effect = [
+            [note('d-null', None), note('d2', '2180-05-01T00:00:00'), note('d1', '2180-01-01T00:00:00')],
+            [note('r2', '2180-04-01T00:00:00'), note('r1', '2180-03-01T00:00:00')]
+        ]
+        
+        result = await get_clinical_notes(
+            mock_db_connection,
+            note_type=NOTE_TYPE_ALL,
+            limit=3,
+            format=OUTPUT_FORMAT_JSON
+        )
+        
+        assert [n['note_id'] for n in json.loads(result)] == ['d-null', 'd2', 'r2']
+    
+    @pytest.mark.asyncio
+    async def test_get_all_notes_merges_by_charttime_not_its_string(self, mock_db_connection):
+        """Test that the merge compares the charttime values, not their ISO strings."""
+        plus_two = timezone(timedelta(hours=2))
+        mock_db_connection.execute_read.side_effect = [
+            [{'note_id': 'd1', 'note_type': 'DS', 'charttime': '2150-01-01T10:05+02:00', 'text': 'x',
+              '_sort': datetime(2150, 1, 1, 10, 5, tzinfo=plus_two)}],
+            [{'note_id': 'r1', 'note_type': 'RR', 'charttime': '2150-01-01T09:00Z', 'text': 'x',
+              '_sort': datetime(2150, 1, 1, 9, 0, tzinfo=timezone.utc)}]
+        ]
+        
+        result = await get_clinical_notes(
+            mock_db_connection,
+            note_type=NOTE_TYPE_ALL,
+            limit=2,
+            format=OUTPUT_FORMAT_JSON
+        )
+        
+        data = json.loads(result)
+        assert [n['note_id'] for n in data] == ['r1', 'd1']
+        assert all('_sort' not in n for n in data)
+    
     @pytest.mark.asyncio
     async def test_get_discharge_notes_by_admission(self, mock_db_connection, sample_discharge_note):
         """Test getting discharge notes for specific admission."""
@@ -53,7 +123,7 @@ class TestGetClinicalNotesFunctionality:
             'note_type': sample_discharge_note.note_type,
             'subject_id': sample_discharge_note.subject_id,
             'hadm_id': sample_discharge_note.hadm_id,
-            'charttime': sample_discharge_note.charttime,
+            'charttime': sample_discharge_note.charttime.isoformat(),
             'text': sample_discharge_note.text
         }]
         
@@ -81,6 +151,7 @@ class TestGetClinicalNotesFunctionality:
         
         assert "note:DischargeNote" in query
         assert "note.hadm_id = $admission_id" in query
+        assert "toString(note.charttime) as charttime" in query
         assert params['admission_id'] == sample_discharge_note.hadm_id
     
     @pytest.mark.asyncio
@@ -149,15 +220,16 @@ class TestGetClinicalNotesFunctionality:
     @pytest.mark.asyncio
     async def test_table_format_output(self, mock_db_connection, sample_discharge_note):
         """Test table format output."""
-        # Mock database response
-        mock_db_connection.execute_read.return_value = [{
+        # Mock database response: one discharge note, no radiology reports
+        mock_db_connection.execute_read.side_effect = [[{
             'note_id': sample_discharge_note.note_id,
             'note_type': sample_discharge_note.note_type,
             'subject_id': sample_discharge_note.subject_id,
             'hadm_id': sample_discharge_note.hadm_id,
-            'charttime': sample_discharge_note.charttime,
+            'charttime': sample_discharge_note.charttime.isoformat(),
+            '_sort': sample_discharge_note.charttime,
             'text': sample_discharge_note.text
-        }]
+        }], []]
         
         # Call function
         result = await get_clinical_notes(
@@ -173,19 +245,24 @@ class TestGetClinicalNotesFunctionality:
         assert "Type" in result
         assert "Patient ID" in result
         assert sample_discharge_note.note_id in result
+        
+        # Only the preview text is fetched for tables
+        query = mock_db_connection.execute_read.call_args_list[0][0][0]
+        assert "substring(note.text, 0, 101) as text" in query
     
     @pytest.mark.asyncio
     async def test_text_format_output(self, mock_db_connection, sample_discharge_note):
         """Test text format output."""
-        # Mock database response
-        mock_db_connection.execute_read.return_value = [{
+        # Mock database response: one discharge note, no radiology reports
+        mock_db_connection.execute_read.side_effect = [[{
             'note_id': sample_discharge_note.note_id,
             'note_type': sample_discharge_note.note_type,
             'subject_id': sample_discharge_note.subject_id,
             'hadm_id': sample_discharge_note.hadm_id,
-            'charttime': sample_discharge_note.charttime,
+            'charttime': sample_discharge_note.charttime.isoformat(),
+            '_sort': sample_discharge_note.charttime,
             'text': sample_discharge_note.text
-        }]
+        }], []]
         
         # Call function
         result = await get_clinical_notes(
@@ -199,4 +276,25 @@ class TestGetClinicalNotesFunctionality:
         assert isinstance(result, str)
         assert f"Note 1/1" in result
         assert f"ID: {sample_discharge_note.note_id}" in result
-        assert sample_discharge_note.text in result
\ No newline at end of file
+        assert sample_discharge_note.text in result
+    
+    @pytest.mark.asyncio
+    async def test_stream_json_yields_one_chunk_per_note(self, mock_db_connection):
+        """Test that streamed JSON chunks join into the get_clinical_notes result."""
+        rows = [
+            {'note_id': f'N{i}', 'note_type': 'DS', 'subject_id': '1', 'hadm_id': None,
+             'charttime': f'2150-01-0{i}T00:00:00', 'text': 'note'}
+            for i in (2, 1)
+        ]
+        mock_db_connection.execute_read.return_value = rows
+        
+        chunks = [c async for c in stream_clinical_notes(
+            mock_db_connection, note_type=NOTE_TYPE_DISCHARGE, limit=5
+        )]
+        
+        assert chunks[0] == "[" and chunks[-1] == "]"
+        assert len(chunks) == len(rows) + 2
+        assert "".join(chunks) == await get_clinical_notes(
+            mock_db_connection, note_type=NOTE_TYPE_DISCHARGE, limit=5
+        )
+        assert [n['note_id'] for n in json.loads("".join(chunks))] == ['N2', 'N1']
@@ -3,7 +3,9 @@
 import json
 import pytest
 
-from ...modules.functionality.get_schema import get_schema, format_schema_as_markdown
+from ...modules.functionality.get_schema import (
+    get_schema, format_schema_as_markdown, format_schema_as_json
+)
 from ...modules.constants import OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_MARKDOWN
 
 
@@ -117,6 +119,37 @@ class TestGetSchemaFunctionality:
         assert data['relationships'] == []
         assert len(data['known_relationships']) == 7
     
+    @pytest.mark.asyncio
+    async def test_get_schema_leaves_connection_schema_untouched(self, mock_db_connection):
+        """Test that the (cached) connection schema is not mutated."""
+        mock_schema = {"nodes": [], "relationships": []}
+        mock_db_connection.get_schema.return_value = mock_schema
+        
+        await get_schema(mock_db_connection, format=OUTPUT_FORMAT_JSON)
+        
+        assert "known_relationships" not in mock_schema
+    
+    def test_format_schema_as_json_reused_for_same_schema(self):
+        """Test that the JSON rendering is reused until the schema object changes."""
+        schema = {"nodes": [], "relationships": []}
+        
+        first = format_schema_as_json(schema)
+        
+        assert format_schema_as_json(schema) is first
+        assert format_schema_as_json({"nodes": [], "relationships": []}) is not first
+        assert len(json.loads(first)['known_relationships']) == 7
+    
+    @pytest.mark.asyncio
+    async def test_get_schema_markdown_reused_for_same_schema(self, mock_db_connection):
+        """Test that the markdown rendering is reused while the connection schema is cached."""
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        
+        first = await get_schema(mock_db_connection, format=OUTPUT_FORMAT_MARKDOWN)
+        
+        assert await get_schema(mock_db_connection, format=OUTPUT_FORMAT_MARKDOWN) is first
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        assert await get_schema(mock_db_connection, format=OUTPUT_FORMAT_MARKDOWN) is not first
+    
     def test_format_schema_as_markdown_complete(self):
         """Test markdown formatting with complete schema."""
         schema = {
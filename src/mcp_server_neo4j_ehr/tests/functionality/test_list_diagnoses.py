@@ -44,11 +44,10 @@ class TestListDiagnosesFunctionality:
     @pytest.mark.asyncio
     async def test_list_diagnoses_by_patient(self, mock_db_connection, sample_diagnosis):
         """Test listing diagnoses for a specific patient."""
-        # Mock database response with admission ID
+        # Mock database response; the query folds the admission ID into the row
         diagnosis_data = sample_diagnosis.model_dump()
         mock_db_connection.execute_read.return_value = [{
-            'd': diagnosis_data,
-            'hadm_id': "22595853"
+            'd': diagnosis_data
         }]
         
         # Call function
@@ -70,6 +69,7 @@ class TestListDiagnosesFunctionality:
         query = mock_db_connection.execute_read.call_args[0][0]
         assert "MATCH (p:Patient {subject_id: $patient_id})" in query
         assert "-[:HAS_ADMISSION]->" in query
+        assert "hadm_id: a.hadm_id" in query
         assert "-[:HAS_DIAGNOSIS]->" in query
     
     @pytest.mark.asyncio
@@ -84,6 +84,47 @@ class TestListDiagnosesFunctionality:
         assert 'error' in data
         assert "Either patient_id or admission_id must be provided" in data['error']
     
+    @pytest.mark.asyncio
+    async def test_list_diagnoses_for_several_patients(self, mock_db_connection, sample_diagnosis):
+        """Test listing diagnoses for several patients in one query."""
+        mock_db_connection.execute_read.return_value = [{
+            'pid': "10000032",
+            'rows': [sample_diagnosis.model_dump()]
+        }]
+        
+        result = await list_diagnoses(
+            mock_db_connection,
+            patient_ids=["10000032", "10000033"],
+            format=OUTPUT_FORMAT_JSON
+        )
+        
+        data = json.loads(result)
+        assert data['count'] == 1
+        assert data['diagnoses']["10000032"][0]['icd_code'] == "I50.9"
+        assert data['diagnoses']["10000033"] == []
+        
+        # One round-trip for all patients
+        mock_db_connection.execute_read.assert_called_once()
+        query, params = mock_db_connection.execute_read.call_args[0]
+        assert "UNWIND $patient_ids AS pid" in query
+        assert params['patient_ids'] == ["10000032", "10000033"]
+        
+        # The limit applies inside the per-patient subquery, not to collected rows
+        subquery = query[query.index("CALL {"):query.rindex("}")]
+        assert "LIMIT $limit" in subquery
+    
+    @pytest.mark.asyncio
+    async def test_list_diagnoses_for_several_patients_rejects_admission(self, mock_db_connection):
+        """Test that admission_id is not silently ignored with patient_ids."""
+        result = await list_diagnoses(
+            mock_db_connection,
+            admission_id="22595853",
+            patient_ids=["10000032", "10000033"]
+        )
+        
+        assert json.loads(result)['error'] == "admission_id cannot be combined with patient_ids"
+        mock_db_connection.execute_read.assert_not_called()
+    
     @pytest.mark.asyncio
     async def test_list_diagnoses_empty_results(self, mock_db_connection):
         """Test handling of empty results."""
@@ -40,6 +40,8 @@ class TestListLabEventsFunctionality:
         query = mock_db_connection.execute_read.call_args[0][0]
         assert "l.subject_id = $patient_id" in query
         assert "ORDER BY l.charttime DESC" in query
+        # Datetimes are rendered by Cypher, not converted per row in Python
+        assert "charttime: toString(l.charttime)" in query
     
     @pytest.mark.asyncio
     async def test_list_lab_events_with_admission(self, mock_db_connection, sample_lab_event):
@@ -103,6 +103,19 @@ class TestListMedicationsFunctionality:
         params = mock_db_connection.execute_read.call_args[0][1]
         assert params['route'] == "po"
     
+    @pytest.mark.asyncio
+    async def test_list_medications_reuses_query_text(self, mock_db_connection):
+        """Test that calls with the same filters send the identical query text."""
+        mock_db_connection.execute_read.return_value = []
+        
+        await list_medications(mock_db_connection, patient_id="10000032", route="PO")
+        await list_medications(mock_db_connection, patient_id="10000033", route="IV")
+        await list_medications(mock_db_connection, admission_id="22595853", route="IV")
+        
+        first, second, third = (c[0][0] for c in mock_db_connection.execute_read.call_args_list)
+        assert first is second
+        assert third != first
+    
     @pytest.mark.asyncio
     async def test_list_medications_no_params_error(self, mock_db_connection):
         """Test error when neither patient_id nor admission_id provided."""
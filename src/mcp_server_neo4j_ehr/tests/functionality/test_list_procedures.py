@@ -45,11 +45,10 @@ class TestListProceduresFunctionality:
     @pytest.mark.asyncio
     async def test_list_procedures_by_patient(self, mock_db_connection, sample_procedure):
         """Test listing procedures for a specific patient."""
-        # Mock database response with admission ID
+        # Mock database response; the query folds the admission ID into the row
         procedure_data = sample_procedure.model_dump()
         mock_db_connection.execute_read.return_value = [{
-            'p': procedure_data,
-            'hadm_id': "22595853"
+            'p': procedure_data
         }]
         
         # Call function
@@ -70,6 +69,7 @@ class TestListProceduresFunctionality:
         query = mock_db_connection.execute_read.call_args[0][0]
         assert "MATCH (pat:Patient {subject_id: $patient_id})" in query
         assert "-[:HAS_ADMISSION]->" in query
+        assert "hadm_id: a.hadm_id" in query
         assert "-[:HAS_PROCEDURE]->" in query
         assert "ORDER BY p.chartdate DESC, p.seq_num" in query
     
@@ -4,13 +4,28 @@ import json
 import os
 import pytest
 from unittest.mock import patch, MagicMock
+from neo4j.exceptions import CypherSyntaxError, ServiceUnavailable
 
-from ...modules.functionality.natural_query import natural_query, format_schema_for_llm
+from ...modules.functionality.natural_query import (
+    natural_query, format_schema_for_llm, apply_display_limit, clear_query_caches,
+    strip_code_fence, _openai_client
+)
 from ...modules.constants import (
-    OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_MARKDOWN
+    OUTPUT_FORMAT_JSON, OUTPUT_FORMAT_TABLE, OUTPUT_FORMAT_MARKDOWN,
+    NATURAL_QUERY_MODEL, NATURAL_QUERY_FALLBACK_MODEL
 )
 
 
+@pytest.fixture(autouse=True)
+def fresh_query_caches():
+    """Start each test without Cypher, results or a client cached by another."""
+    clear_query_caches()
+    _openai_client.cache_clear()
+    yield
+    clear_query_caches()
+    _openai_client.cache_clear()
+
+
 class TestNaturalQueryFunctionality:
     """Test suite for natural language query functionality."""
     
@@ -44,7 +59,7 @@ class TestNaturalQueryFunctionality:
         )
         
         # Execute test
-        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.OpenAI', return_value=mock_openai_response):
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
             result = await natural_query(
                 mock_db_connection,
                 query="How many admissions does patient 10000032 have?",
@@ -81,7 +96,7 @@ class TestNaturalQueryFunctionality:
             )]
         )
         
-        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.OpenAI', return_value=mock_openai_response):
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
             result = await natural_query(
                 mock_db_connection,
                 query="Show me all patients",
@@ -107,7 +122,7 @@ class TestNaturalQueryFunctionality:
             )]
         )
         
-        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.OpenAI', return_value=mock_openai_response):
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
             result = await natural_query(
                 mock_db_connection,
                 query="Test query",
@@ -129,7 +144,7 @@ class TestNaturalQueryFunctionality:
         mock_client = MagicMock()
         mock_client.chat.completions.create.side_effect = Exception("API Error")
         
-        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.OpenAI', return_value=mock_client):
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_client):
             result = await natural_query(
                 mock_db_connection,
                 query="Test query",
@@ -158,7 +173,7 @@ class TestNaturalQueryFunctionality:
             )]
         )
         
-        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.OpenAI', return_value=mock_openai_response):
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
             result = await natural_query(
                 mock_db_connection,
                 query="Show me patient diagnoses",
@@ -188,7 +203,7 @@ class TestNaturalQueryFunctionality:
             )]
         )
         
-        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.OpenAI', return_value=mock_openai_response):
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
             result = await natural_query(
                 mock_db_connection,
                 query="Test query",
@@ -202,6 +217,170 @@ class TestNaturalQueryFunctionality:
         assert "name" in result
         assert "value" in result
     
+    @pytest.mark.asyncio
+    async def test_natural_query_static_prompt_prefix(self, mock_db_connection, mock_openai_response):
+        """Test that the system prompt stays identical across questions and limits."""
+        mock_db_connection.get_schema.return_value = {
+            "nodes": [{"label": "Patient", "properties": ["subject_id"]}],
+            "relationships": []
+        }
+        mock_db_connection.execute_read.return_value = []
+        mock_openai_response.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN p LIMIT 5'))]
+        )
+        
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
+            await natural_query(mock_db_connection, query="First question", limit=5,
+                                format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+            await natural_query(mock_db_connection, query="Second question", limit=50,
+                                format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+        
+        first, second = [
+            call.kwargs['messages'] for call in mock_openai_response.chat.completions.create.call_args_list
+        ]
+        assert first[0] == second[0]
+        assert "Node: Patient" in first[0]['content']
+        assert "First question" in first[1]['content']
+        assert "LIMIT 50" in second[1]['content']
+    
+    @pytest.mark.asyncio
+    async def test_natural_query_display_limit(self, mock_db_connection, mock_openai_response):
+        """Test that display_limit caps the executed query server-side."""
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        mock_db_connection.execute_read.return_value = []
+        mock_openai_response.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN p LIMIT 10'))]
+        )
+        
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
+            result = await natural_query(mock_db_connection, query="Show me patients", limit=10,
+                                         format=OUTPUT_FORMAT_JSON, openai_api_key="test-key",
+                                         display_limit=5)
+        
+        executed = mock_db_connection.execute_read.call_args[0][0]
+        assert executed == "MATCH (p:Patient) RETURN p LIMIT 5"
+        assert json.loads(result)['cypher_query'] == executed
+    
+    @pytest.mark.asyncio
+    async def test_natural_query_display_limit_without_limit_clause(self, mock_db_connection, mock_openai_response):
+        """Test that a query with no rewritable LIMIT runs as generated and is read only to display_limit."""
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        mock_db_connection.execute_read.return_value = [{"p.subject_id": str(i)} for i in range(10)]
+        mock_openai_response.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN p.subject_id'))]
+        )
+        
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
+            result = await natural_query(mock_db_connection, query="Show me patients", limit=10,
+                                         format=OUTPUT_FORMAT_JSON, openai_api_key="test-key",
+                                         display_limit=5)
+        
+        data = json.loads(result)
+        assert mock_db_connection.stream_read.call_args[0][0] == "MATCH (p:Patient) RETURN p.subject_id"
+        assert data['cypher_query'] == "MATCH (p:Patient) RETURN p.subject_id"
+        assert data['count'] == 5
+    
+    @pytest.mark.asyncio
+    async def test_natural_query_reuses_cypher_and_results(self, mock_db_connection, mock_openai_response):
+        """Test that a repeated question skips both the LLM and Neo4j."""
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        mock_db_connection.execute_read.return_value = [{"count": 3}]
+        mock_openai_response.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN count(p) as count'))]
+        )
+        
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
+            first = await natural_query(mock_db_connection, query="How many patients?",
+                                        format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+            second = await natural_query(mock_db_connection, query="  how many   PATIENTS? ",
+                                         format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+            await natural_query(mock_db_connection, query="How many patients",
+                                format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+        
+        assert mock_openai_response.chat.completions.create.call_count == 1
+        assert mock_db_connection.execute_read.call_count == 1
+        assert json.loads(second)['results'] == json.loads(first)['results'] == [{"count": 3}]
+    
+    @pytest.mark.asyncio
+    async def test_natural_query_results_cached_per_database(self, mock_db_connection, mock_openai_response):
+        """Test that the same Cypher against another database is not served from cache."""
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        mock_db_connection.execute_read.return_value = [{"count": 3}]
+        mock_openai_response.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN count(p) as count'))]
+        )
+        
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
+            await natural_query(mock_db_connection, query="How many patients?",
+                                format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+            mock_db_connection.database = "other"
+            await natural_query(mock_db_connection, query="How many patients?",
+                                format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+        
+        assert mock_db_connection.execute_read.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_natural_query_retries_failed_cypher_with_fallback_model(
+        self, mock_db_connection, mock_openai_response
+    ):
+        """Test that Cypher failing to run is regenerated once by the fallback model."""
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        mock_db_connection.execute_read.side_effect = [CypherSyntaxError("Unknown function 'cnt'"), [{"count": 3}]]
+        mock_openai_response.chat.completions.create.side_effect = [
+            MagicMock(choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN cnt(p) as count'))]),
+            MagicMock(choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN count(p) as count'))]),
+        ]
+        
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
+            result = await natural_query(mock_db_connection, query="How many patients?",
+                                         format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+        
+        data = json.loads(result)
+        assert data['cypher_query'] == "MATCH (p:Patient) RETURN count(p) as count"
+        assert data['results'] == [{"count": 3}]
+        
+        first, second = mock_openai_response.chat.completions.create.call_args_list
+        assert first.kwargs['model'] == NATURAL_QUERY_MODEL
+        assert second.kwargs['model'] == NATURAL_QUERY_FALLBACK_MODEL
+        assert "Unknown function 'cnt'" in second.kwargs['messages'][1]['content']
+        assert second.kwargs['messages'][0] == first.kwargs['messages'][0]
+    
+    @pytest.mark.asyncio
+    async def test_natural_query_does_not_retry_driver_errors(self, mock_db_connection, mock_openai_response):
+        """Test that an unreachable database is reported without asking the fallback model."""
+        mock_db_connection.get_schema.return_value = {"nodes": [], "relationships": []}
+        mock_db_connection.execute_read.side_effect = ServiceUnavailable("Connection refused")
+        mock_openai_response.chat.completions.create.return_value = MagicMock(
+            choices=[MagicMock(message=MagicMock(content='MATCH (p:Patient) RETURN count(p) as count'))]
+        )
+        
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
+            result = await natural_query(mock_db_connection, query="How many patients?",
+                                         format=OUTPUT_FORMAT_JSON, openai_api_key="test-key")
+        
+        assert json.loads(result)['error'] == "Failed to execute generated query"
+        assert mock_openai_response.chat.completions.create.call_count == 1
+        assert mock_db_connection.execute_read.call_count == 1
+    
+    def test_apply_display_limit(self):
+        """Test that only a single-part query's trailing LIMIT is rewritten."""
+        assert apply_display_limit("MATCH (n) RETURN n LIMIT 3;", 5) == "MATCH (n) RETURN n LIMIT 3"
+        assert apply_display_limit("MATCH (n) RETURN n limit 50", 5) == "MATCH (n) RETURN n LIMIT 5"
+        assert apply_display_limit("MATCH (n) RETURN count(n)", 5) is None
+        assert apply_display_limit(
+            "MATCH (a:A) RETURN a.x AS x UNION MATCH (b:B) RETURN b.x AS x LIMIT 10", 5
+        ) is None
+    
+    def test_strip_code_fence(self):
+        """Test extracting Cypher from fenced LLM responses."""
+        query = "MATCH (p:Patient) RETURN p LIMIT 5"
+        assert strip_code_fence(query) == query
+        assert strip_code_fence(f"```cypher\n{query}\n```") == query
+        assert strip_code_fence(f"  ~~~CQL\n{query}\n~~~\n") == query
+        assert strip_code_fence(f"```\n{query}") == query
+        assert strip_code_fence(f"Here is the query:\n```cypher\n{query}\n```") == query
+        assert strip_code_fence(f"```cypher\n{query}\n```\nOr:\n```cypher\nMATCH (n) RETURN n\n```") == query
+    
     def test_format_schema_for_llm(self):
         """Test schema formatting for LLM context."""
         schema = {
@@ -238,7 +417,7 @@ class TestNaturalQueryFunctionality:
             )]
         )
         
-        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.OpenAI', return_value=mock_openai_response):
+        with patch('src.mcp_server_neo4j_ehr.modules.functionality.natural_query.AsyncOpenAI', return_value=mock_openai_response):
             result = await natural_query(
                 mock_db_connection,
                 query="Find non-existent data",
@@ -74,6 +74,29 @@ class TestPatientFunctionality:
         query = mock_db_connection.execute_read.call_args[0][0]
         assert "OPTIONAL MATCH (p)-[:HAS_ADMISSION]->(a:Admission)" in query
     
+    @pytest.mark.asyncio
+    async def test_get_patient_collects_each_relationship_separately(self, mock_db_connection, sample_patient):
+        """Test that related nodes are collected in per-relationship subqueries."""
+        mock_db_connection.execute_read.return_value = [{
+            'p': sample_patient.model_dump(),
+            'diagnoses': [],
+            'lab_events': []
+        }]
+        
+        await get_patient(
+            mock_db_connection,
+            subject_id="10000032",
+            include_admissions=False,
+            include_diagnoses=True,
+            include_lab_events=True
+        )
+        
+        # No cartesian product of diagnoses and lab events, and both anchored on the patient
+        query = mock_db_connection.execute_read.call_args[0][0]
+        assert query.count("CALL {") == 2
+        assert "(p)-[:HAS_ADMISSION]->(:Admission)-[:HAS_DIAGNOSIS]->(d:Diagnosis)" in query
+        assert "(p)-[:HAS_ADMISSION]->(:Admission)-[:INCLUDES_LAB_EVENT]->(l:LabEvent)" in query
+    
     @pytest.mark.asyncio
     async def test_get_patient_with_all_data(
         self, mock_db_connection, sample_patient, sample_admission,
@@ -0,0 +1,92 @@
+"""Tests for the Neo4j connection wrapper."""
+
+import pytest
+from unittest.mock import MagicMock
+from neo4j.exceptions import CypherSyntaxError, TransientError
+
+from ..modules import db_connection
+from ..modules.db_connection import Neo4jConnection
+
+
+class _Record:
+    def __init__(self, data):
+        self._data = data
+    
+    def data(self):
+        return self._data
+
+
+class _Session:
+    """Async session whose run() replays the next scripted outcome."""
+    
+    def __init__(self, outcomes):
+        self._outcomes = outcomes
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+    
+    async def run(self, query, parameters):
+        outcome = self._outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return self._stream(outcome)
+    
+    @staticmethod
+    async def _stream(items):
+        for item in items:
+            if isinstance(item, Exception):
+                raise item
+            yield _Record(item)
+
+
+def _connection(*outcomes):
+    driver = MagicMock()
+    session = _Session(list(outcomes))
+    driver.session.return_value = session
+    return Neo4jConnection(driver), driver
+
+
+@pytest.fixture(autouse=True)
+def no_retry_delay(monkeypatch):
+    """Skip the backoff between retries."""
+    monkeypatch.setattr(db_connection, "STREAM_READ_RETRY_DELAY", 0.0)
+
+
+class TestStreamRead:
+    """Test suite for streamed reads."""
+    
+    @pytest.mark.asyncio
+    async def test_stream_read_retries_transient_error_before_first_record(self):
+        """Test that a transient failure before any record is yielded is retried."""
+        db, driver = _connection(TransientError("leader switch"), [{"n": 1}, {"n": 2}])
+        
+        rows = [row async for row in db.stream_read("MATCH (n) RETURN n")]
+        
+        assert rows == [{"n": 1}, {"n": 2}]
+        assert driver.session.call_count == 2
+    
+    @pytest.mark.asyncio
+    async def test_stream_read_raises_transient_error_after_first_record(self):
+        """Test that a failure after records were yielded is raised, not replayed."""
+        db, driver = _connection([{"n": 1}, TransientError("leader switch")], [{"n": 1}])
+        
+        rows = []
+        with pytest.raises(TransientError):
+            async for row in db.stream_read("MATCH (n) RETURN n"):
+                rows.append(row)
+        
+        assert rows == [{"n": 1}]
+        assert driver.session.call_count == 1
+    
+    @pytest.mark.asyncio
+    async def test_stream_read_does_not_retry_client_errors(self):
+        """Test that errors a retry can't fix are raised at once."""
+        db, driver = _connection(CypherSyntaxError("bad query"), [])
+        
+        with pytest.raises(CypherSyntaxError):
+            [row async for row in db.stream_read("MATCH (n RETURN n")]
+        
+        assert driver.session.call_count == 1
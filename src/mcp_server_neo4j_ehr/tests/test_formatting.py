@@ -0,0 +1,36 @@
+"""Tests for the shared output formatting helpers."""
+
+from ..modules.formatting import render_grid
+
+
+class TestRenderGrid:
+    """Test suite for the grid table renderer."""
+    
+    def test_render_grid_layout(self):
+        """Test the grid table layout, including multi-line cells."""
+        result = render_grid([["a\nbb", "x"], ["ccc", "y"]], ["ID", "Type"])
+        
+        assert result == (
+            "+------+--------+\n"
+            "| ID   | Type   |\n"
+            "+======+========+\n"
+            "| a    | x      |\n"
+            "| bb   |        |\n"
+            "+------+--------+\n"
+            "| ccc  | y      |\n"
+            "+------+--------+"
+        )
+    
+    def test_render_grid_right_aligns_numeric_columns(self):
+        """Test that all-numeric columns are right-aligned and their values kept as given."""
+        result = render_grid([["10000032", "1.50", "N/A"], ["7", None, "12"]], ["Patient ID", "Value", "Seq"])
+        
+        assert result == (
+            "+--------------+---------+-------+\n"
+            "|   Patient ID |   Value | Seq   |\n"
+            "+==============+=========+=======+\n"
+            "|     10000032 |    1.50 | N/A   |\n"
+            "+--------------+---------+-------+\n"
+            "|            7 |         | 12    |\n"
+            "+--------------+---------+-------+"
+        )